@@ -1,18 +1,38 @@
 import sqlite3
 import io
-from datetime import datetime, timedelta, date 
+import csv
+import zipfile
+import tempfile
+import json
+import time
+import hashlib
+import threading
+import re
+import uuid
+import bisect
+import heapq
+import itertools
+import unicodedata
+import functools
+import importlib.util
+from contextlib import contextmanager
+from collections import OrderedDict
+import base64
+from datetime import datetime, timedelta, date, timezone
 from flask import (
     Flask, render_template, request, jsonify, send_file, g, current_app,
-    redirect, url_for, flash, session 
+    redirect, url_for, flash, session, stream_with_context, abort
 )
+import click
 from werkzeug.security import generate_password_hash, check_password_hash 
 from flask_login import (
-    LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+    LoginManager, login_user, logout_user, login_required, current_user
 ) 
 
-import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.utils import get_column_letter
+# openpyxl (planilhas), pyarrow (Parquet) e o pool de processos das exportações
+# são importados só no primeiro uso, dentro das funções que os usam: a maioria dos
+# workers nunca gera nem importa planilhas, e assim sobe mais rápido e com menos
+# memória (ver benchmarks/bench_startup.py).
 import os # Adicionado para o caminho do banco de dados (se não estava antes)
 
 # --- Configuração da Aplicação Flask ---
@@ -21,7 +41,70 @@ app = Flask(__name__)
 # Caminho absoluto para o banco de dados
 project_root = os.path.dirname(os.path.abspath(__file__))
 app.config['DATABASE'] = os.path.join(project_root, 'sangria_doadores.db')
+# Aplica as migrações pendentes do schema ao criar a aplicação (create_app), e quanto
+# tempo (s) um worker espera enquanto outro, subindo junto, aplica a migração.
+app.config['DATABASE_AUTO_MIGRATE'] = True
+app.config['DATABASE_MIGRATE_TIMEOUT'] = 600
 app.config['SECRET_KEY'] = 'uma_chave_secreta_muito_segura_e_dificil_de_adivinhar_123!@#' # Mantenha uma chave forte!
+# Exportação da planilha: linhas lidas por vez do cursor e tamanho a partir do qual
+# o arquivo temporário da planilha deixa a memória e vai para o disco.
+app.config['EXPORT_FETCH_SIZE'] = 1000
+app.config['EXPORT_SPOOL_MAX_BYTES'] = 4 * 1024 * 1024
+# Importação em lote: doadores inseridos por transação.
+app.config['IMPORT_BATCH_SIZE'] = 500
+# Tabela de regras da triagem e intervalo (s) entre verificações de alteração do arquivo.
+app.config['TRIAGE_RULES_PATH'] = os.path.join(project_root, 'triage_rules.json')
+app.config['TRIAGE_RULES_CHECK_INTERVAL'] = 5
+# Conexões SQLite: WAL permite leituras simultâneas a uma escrita, e
+# synchronous=NORMAL é seguro com WAL (só perde a última transação em queda de energia).
+app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = 5000
+app.config['SQLITE_MMAP_SIZE'] = 256 * 1024 * 1024
+app.config['SQLITE_CACHE_SIZE_KB'] = 16 * 1024
+app.config['SQLITE_REUSE_CONNECTIONS'] = True
+# Cache de usuários do Flask-Login: validade (s) e número máximo de usuários guardados.
+app.config['USER_CACHE_TTL'] = 60
+app.config['USER_CACHE_MAX_ENTRIES'] = 1024
+# Login: token buckets de tentativas por IP (todo login e cadastro de usuário) e de
+# senhas erradas por usuário: capacidade (rajada) e fichas repostas por segundo,
+# e número máximo de chaves guardadas. Os limites valem por worker.
+app.config['LOGIN_IP_BURST'] = 20
+app.config['LOGIN_IP_RATE'] = 0.5
+app.config['LOGIN_USER_BURST'] = 5
+app.config['LOGIN_USER_RATE'] = 1 / 60
+app.config['LOGIN_LIMITER_MAX_KEYS'] = 10000
+# Hash de senhas: método no formato do werkzeug (hashes em outro método ou com
+# outros parâmetros são refeitos no login seguinte), cálculos simultâneos por
+# worker e espera máxima (s) por um cálculo livre antes de responder 503.
+app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'
+app.config['PASSWORD_HASH_CONCURRENCY'] = 1
+app.config['PASSWORD_HASH_WAIT'] = 5.0
+# Memória máxima para planilhas já geradas, reaproveitadas enquanto os dados não mudam.
+app.config['SPREADSHEET_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+# Feed em tempo real (SSE): intervalo de consulta, heartbeat e duração máxima de
+# cada conexão (s; o navegador reconecta sozinho), e retenção do registro de alterações.
+app.config['SSE_POLL_INTERVAL'] = 1.0
+app.config['SSE_HEARTBEAT_INTERVAL'] = 15
+app.config['SSE_MAX_DURATION'] = 300
+app.config['SSE_BATCH_SIZE'] = 200
+app.config['DONOR_CHANGES_RETENTION_DAYS'] = 7
+# Exportação em segundo plano: pasta dos arquivos gerados, processos do pool e
+# tempo (h) que um job finalizado e seu arquivo são mantidos.
+app.config['EXPORT_JOBS_DIR'] = os.path.join(project_root, 'exports')
+app.config['EXPORT_JOB_WORKERS'] = 2
+app.config['EXPORT_JOB_RETENTION_HOURS'] = 24
+# Job na fila ou em andamento há mais que isto (min) é dado como perdido (ex.: o
+# processo web que o enviou reiniciou) e marcado como falho.
+app.config['EXPORT_JOB_TIMEOUT_MINUTES'] = 60
+# Instrumentação: histogramas por rota e fase em /metrics (formato Prometheus) e
+# cabeçalho Server-Timing nas respostas a usuários logados. Com METRICS_TOKEN
+# definido, /metrics exige "Authorization: Bearer <token>"; sem ele, só um
+# administrador logado acessa.
+app.config['METRICS_ENABLED'] = True
+app.config['METRICS_SERVER_TIMING'] = True
+app.config['METRICS_TOKEN'] = None
+app.config['METRICS_BUCKETS'] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
 # --- Configuração do Flask-Login ---
 login_manager = LoginManager()
@@ -31,8 +114,273 @@ login_manager.login_message = "Por favor, faça login para acessar esta página.
 login_manager.login_message_category = "error"
 
 
-# --- Modelo de Usuário (UserMixin para Flask-Login) ---
-class User(UserMixin):
+# --- Instrumentação (métricas e Server-Timing) ---
+# Cada requisição acumula, sem locks, o tempo das fases (metrics_phase) e das
+# consultas SQL (conexões de get_db) em um objeto da thread atual; no fim da
+# requisição os valores vão para os histogramas do processo, expostos em /metrics,
+# e para o cabeçalho Server-Timing. Em produção com vários workers, cada processo
+# tem seus próprios contadores (o Prometheus soma por instância).
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # o último é o +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Contadores e histogramas do processo, com rótulos, no formato texto do Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}    # (nome, rótulos) -> valor
+        self._histograms = {}  # (nome, rótulos) -> Histogram
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def record_request(self, route, method, status, duration, timings):
+        """Registra uma requisição inteira com um único lock."""
+        route_labels = (('route', route), ('method', method))
+        with self._lock:
+            for name, labels, value in (
+                ('sangria_http_request_duration_seconds', route_labels, duration),
+                ('sangria_sql_duration_seconds', route_labels, timings.sql_time),
+            ):
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[(name, labels)] = Histogram(self.buckets)
+                histogram.observe(value)
+            for phase, value in timings.phases.items():
+                key = ('sangria_phase_duration_seconds', (('phase', phase),))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.buckets)
+                histogram.observe(value)
+            for name, labels, value in (
+                ('sangria_http_requests_total', route_labels + (('status', str(status)),), 1),
+                ('sangria_sql_queries_total', route_labels, timings.sql_count),
+            ):
+                self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+    def render(self, extra_counters=()):
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()]
+        counters.extend(((name, labels), value) for name, labels, value in extra_counters)
+
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, text = self._help[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in sorted(counters):
+            header(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), counts, total, count in sorted(histograms, key=lambda item: item[0]):
+            header(name)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestTimings:
+    """Tempos acumulados durante uma requisição (só a thread da requisição escreve)."""
+    __slots__ = ('started', 'sql_count', 'sql_time', 'phases')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.phases = {}
+
+
+metrics = MetricsRegistry(app.config['METRICS_BUCKETS'])
+metrics.describe('sangria_http_requests_total', 'counter', "Requisições atendidas por rota, método e status.")
+metrics.describe('sangria_http_request_duration_seconds', 'histogram', "Duração das requisições por rota.")
+metrics.describe('sangria_sql_queries_total', 'counter', "Consultas SQL executadas por rota.")
+metrics.describe('sangria_sql_duration_seconds', 'histogram', "Tempo em consultas SQL por requisição, por rota.")
+metrics.describe('sangria_phase_duration_seconds', 'histogram', "Duração das fases instrumentadas (triagem, gravação, planilha...).")
+metrics.describe('sangria_user_cache_events_total', 'counter', "Acertos, falhas e descartes do cache de usuários.")
+metrics.describe('sangria_login_throttled_total', 'counter', "Tentativas de login/cadastro recusadas (limite por IP, por usuário ou hash ocupado).")
+
+_metrics_local = threading.local()
+
+
+def current_timings():
+    return getattr(_metrics_local, 'timings', None)
+
+
+@contextmanager
+def metrics_phase(name):
+    """Mede um trecho do caminho crítico; dentro de uma requisição, entra também no Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings = current_timings()
+        if timings is not None:
+            timings.phases[name] = timings.phases.get(name, 0.0) + elapsed
+        elif app.config['METRICS_ENABLED']:
+            metrics.observe('sangria_phase_duration_seconds', (('phase', name),), elapsed)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        timings = current_timings()
+        if timings is None:
+            return super().execute(*args)
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            timings.sql_time += time.perf_counter() - started
+            timings.sql_count += 1
+
+    def executemany(self, *args):
+        timings = current_timings()
+        if timings is None:
+            return super().executemany(*args)
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            timings.sql_time += time.perf_counter() - started
+            timings.sql_count += 1
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexão que conta e cronometra as consultas da requisição atual.
+
+    O tempo medido é o do execute (preparo e primeiro passo da consulta); a leitura
+    das linhas seguintes (fetch) fica no tempo da fase ou da rota.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        timings = current_timings()
+        if timings is None:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            timings.sql_time += time.perf_counter() - started
+            timings.sql_count += 1
+
+
+@app.before_request
+def start_request_timings():
+    if app.config['METRICS_ENABLED']:
+        _metrics_local.timings = RequestTimings()
+
+
+@app.after_request
+def record_request_timings(response):
+    timings = current_timings()
+    if timings is None:
+        return response
+    _metrics_local.timings = None
+    duration = time.perf_counter() - timings.started
+    route = request.url_rule.rule if request.url_rule is not None else 'desconhecida'
+    metrics.record_request(route, request.method, response.status_code, duration, timings)
+    # Tempos e número de consultas só para usuários logados: a um anônimo (ex.: a
+    # tela de login) eles revelariam detalhes do servidor.
+    if app.config['METRICS_SERVER_TIMING'] and current_user.is_authenticated:
+        entries = [f"app;dur={duration * 1000:.2f}",
+                   f'sql;dur={timings.sql_time * 1000:.2f};desc="{timings.sql_count} consultas"']
+        entries.extend(f"{phase};dur={value * 1000:.2f}" for phase, value in timings.phases.items())
+        response.headers['Server-Timing'] = ", ".join(entries)
+    return response
+
+
+@app.teardown_request
+def discard_request_timings(e=None):
+    # Requisições que terminaram sem passar pelo after_request não deixam sobras na thread.
+    _metrics_local.timings = None
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            abort(401)
+    elif not current_user.is_authenticated:
+        abort(401)
+    elif not current_user.is_admin:
+        abort(403)
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    cache_stats = user_cache.stats()
+    extra = [
+        ('sangria_user_cache_events_total', (('event', event),), cache_stats[event])
+        for event in ('hits', 'misses', 'evictions')
+    ]
+    extra += [
+        ('sangria_login_throttled_total', (('reason', 'ip'),), login_ip_limiter.rejected),
+        ('sangria_login_throttled_total', (('reason', 'user'),), login_user_limiter.rejected),
+        ('sangria_login_throttled_total', (('reason', 'hash_busy'),), password_hasher.busy),
+    ]
+    return current_app.response_class(metrics.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- Modelo de Usuário (interface do Flask-Login) ---
+# Classe compacta com __slots__: as instâncias ficam guardadas no cache de
+# usuários, então não carregam um __dict__ cada.
+class User:
+    __slots__ = ('id', 'username', 'full_name', 'password_hash', 'is_admin')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
     def __init__(self, id, username, full_name, password_hash=None, is_admin=False): 
         self.id = id
         self.username = username
@@ -43,48 +391,579 @@ class User(UserMixin):
     def get_id(self): 
         return str(self.id)
 
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.get_id())
+
+
+class UserCache:
+    """Cache LRU com validade (TTL) dos usuários carregados a cada requisição.
+
+    Alterações feitas pela própria aplicação invalidam a entrada na hora
+    (invalidate); alterações feitas fora deste processo, como uma edição manual
+    de is_admin no banco, valem no máximo após o TTL.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(user_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+user_cache = UserCache(app.config['USER_CACHE_MAX_ENTRIES'], app.config['USER_CACHE_TTL'])
+
 # Callback para carregar usuário da sessão
 @login_manager.user_loader
 def load_user(user_id):
-    db = get_db()
-    user_data = db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    with metrics_phase('load_user'):
+        db = get_db(readonly=True)
+        user_data = db.execute('SELECT id, username, full_name, is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
     if user_data:
-        return User(
+        user = User(
             id=user_data['id'], 
             username=user_data['username'], 
             full_name=user_data['full_name'], 
-            password_hash=user_data['password_hash'],
             is_admin=bool(user_data['is_admin']) 
         )
+        user_cache.put(user_id, user)
+        return user
     return None
 
+
+def set_user_admin(db, user_id, is_admin):
+    db.execute('UPDATE users SET is_admin = ? WHERE id = ?', (1 if is_admin else 0, user_id))
+    db.commit()
+    user_cache.invalidate(user_id)
+
+
+def set_user_password_hash(db, user_id, password_hash):
+    db.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+    db.commit()
+    user_cache.invalidate(user_id)
+
+
+# --- Proteção do Login (limite de tentativas e custo do hash) ---
+# O hash de senha é caro de propósito (o scrypt padrão leva dezenas de ms de CPU).
+# Para que uma rajada de logins ou um ataque de força bruta não ocupe a CPU dos
+# workers e atrase a triagem e o cadastro de doadores:
+#   * cada IP tem um token bucket de tentativas e cada usuário um de senhas
+#     erradas; sem ficha, a resposta é 429 e nenhum hash é calculado;
+#   * no máximo PASSWORD_HASH_CONCURRENCY hashes são calculados ao mesmo tempo no
+#     worker; quem espera mais que PASSWORD_HASH_WAIT recebe 503.
+# Como o cache de usuários, tudo fica na memória do processo: com vários workers,
+# o limite efetivo é o configurado vezes o número de workers.
+class TokenBucketLimiter:
+    """Token buckets por chave (IP, usuário) em memória, com no máximo `max_keys` chaves.
+
+    Cada chave começa com `capacity` fichas e ganha `rate` fichas por segundo, até
+    a capacidade. Além de max_keys, a chave usada há mais tempo é descartada (e
+    volta cheia se reaparecer).
+    """
+
+    def __init__(self, capacity, rate, max_keys):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # chave -> [fichas, instante da última reposição]
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def consume(self, key, dry_run=False):
+        """Gasta uma ficha de `key` (com dry_run, só confere se há uma).
+
+        Retorna 0 se havia ficha, ou os segundos até a próxima.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.capacity), now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            if bucket[0] >= 1:
+                if not dry_run:
+                    bucket[0] -= 1
+                return 0
+            self.rejected += 1
+            return (1 - bucket[0]) / self.rate
+
+
+class PasswordHashBusy(Exception):
+    """Nenhum cálculo de hash livre dentro de PASSWORD_HASH_WAIT."""
+
+
+class PasswordHasher:
+    """Gera e confere hashes de senha com no máximo `concurrency` cálculos simultâneos."""
+
+    def __init__(self, method, concurrency, wait):
+        self.method = method
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._method_prefix = None
+        self.busy = 0
+
+    @contextmanager
+    def _slot(self):
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self.busy += 1
+            raise PasswordHashBusy()
+        try:
+            with metrics_phase('password_hash'):
+                yield
+        finally:
+            self._slots.release()
+
+    def _needs_rehash(self, password_hash):
+        # "método:parâmetros" antes do primeiro '$'. O prefixo de referência vem de
+        # um hash gerado agora, que traz os parâmetros por extenso mesmo quando o
+        # método foi configurado sem eles (ex.: 'pbkdf2:sha256').
+        if self._method_prefix is None:
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def hash(self, password):
+        with self._slot():
+            return generate_password_hash(password, self.method)
+
+    def verify(self, password_hash, password):
+        """(senha confere, novo hash ou None).
+
+        O novo hash vem quando o atual foi gerado com outro método ou outros
+        parâmetros; quem chama o grava (set_user_password_hash).
+        """
+        with self._slot():
+            if not check_password_hash(password_hash, password):
+                return False, None
+            if self._needs_rehash(password_hash):
+                return True, generate_password_hash(password, self.method)
+            return True, None
+
+
+login_ip_limiter = TokenBucketLimiter(
+    app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_RATE'], app.config['LOGIN_LIMITER_MAX_KEYS']
+)
+login_user_limiter = TokenBucketLimiter(
+    app.config['LOGIN_USER_BURST'], app.config['LOGIN_USER_RATE'], app.config['LOGIN_LIMITER_MAX_KEYS']
+)
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_CONCURRENCY'], app.config['PASSWORD_HASH_WAIT']
+)
+
+
+def throttled_response(template, retry_after, status=429):
+    """Página do formulário com aviso, status 429 (limite) ou 503 (hash ocupado) e Retry-After."""
+    flash('Muitas tentativas em pouco tempo. Aguarde um instante e tente novamente.', 'error')
+    response = current_app.make_response((render_template(template), status))
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+
 # --- Funções do Banco de Dados ---
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            app.config['DATABASE'], # Já usa o caminho absoluto configurado acima
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
-    return g.db
+# Cada thread do worker mantém suas conexões abertas entre requisições (uma de
+# escrita e uma somente leitura por banco), em vez de abrir uma nova a cada
+# requisição. Ao reutilizar, a conexão passa por uma verificação rápida e é
+# reaberta se estiver inválida.
+_db_local = threading.local()
+
+def _open_connection(path, readonly):
+    db = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000,
+        factory=InstrumentedConnection
+    )
+    db.row_factory = sqlite3.Row
+    if not readonly and app.config['SQLITE_JOURNAL_MODE']:
+        # O modo do journal fica gravado no arquivo; basta a conexão de escrita definir.
+        db.execute(f"PRAGMA journal_mode = {app.config['SQLITE_JOURNAL_MODE']}")
+    if app.config['SQLITE_SYNCHRONOUS']:
+        db.execute(f"PRAGMA synchronous = {app.config['SQLITE_SYNCHRONOUS']}")
+    db.execute(f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    if app.config['SQLITE_MMAP_SIZE'] is not None:
+        db.execute(f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_SIZE'])}")
+    if app.config['SQLITE_CACHE_SIZE_KB'] is not None:
+        # Valor negativo = tamanho em KiB (positivo seria em páginas).
+        db.execute(f"PRAGMA cache_size = -{int(app.config['SQLITE_CACHE_SIZE_KB'])}")
+    if readonly:
+        db.execute("PRAGMA query_only = ON")
+    return db
+
+def _connection_is_healthy(db):
+    try:
+        db.execute("SELECT 1").fetchone()
+        return True
+    except sqlite3.Error:
+        return False
+
+def _acquire_connection(readonly):
+    path = app.config['DATABASE']
+    if not app.config['SQLITE_REUSE_CONNECTIONS']:
+        return _open_connection(path, readonly)
+
+    pool = getattr(_db_local, 'connections', None)
+    if pool is None:
+        pool = _db_local.connections = {}
+    key = (path, readonly)
+    db = pool.get(key)
+    if db is not None and not _connection_is_healthy(db):
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+        db = None
+    if db is None:
+        db = pool[key] = _open_connection(path, readonly)
+    return db
+
+def _release_connection(db):
+    if not app.config['SQLITE_REUSE_CONNECTIONS']:
+        db.close()
+        return
+    # A conexão volta para a thread sem transação pendente.
+    try:
+        if db.in_transaction:
+            db.rollback()
+    except sqlite3.Error:
+        db.close()
+
+def get_db(readonly=False):
+    """Conexão da requisição atual. Use readonly=True em rotas que só leem."""
+    key = 'db_readonly' if readonly else 'db'
+    if key not in g:
+        setattr(g, key, _acquire_connection(readonly))
+    return getattr(g, key)
 
 @app.teardown_appcontext
 def close_db(e=None):
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    for key in ('db', 'db_readonly'):
+        db = g.pop(key, None)
+        if db is not None:
+            _release_connection(db)
+
+
+# --- Schema e Migrações ---
+# A versão do schema fica no cabeçalho do banco (PRAGMA user_version). Um banco
+# novo recebe o schema.sql e já nasce na versão SCHEMA_VERSION; um banco existente
+# recebe, em ordem, as migrações de SCHEMA_MIGRATIONS que faltam, na mesma
+# transação que grava a nova versão. create_app executa migrate_db ao subir: com
+# o banco em dia, é só a leitura do user_version. Com vários workers subindo
+# juntos, o BEGIN IMMEDIATE faz um só aplicar as migrações; os demais esperam e
+# encontram a versão já atualizada.
+def schema_statements():
+    """Comandos do schema.sql, um por item.
+
+    Executados um a um dentro da transação da migração (executescript faria
+    COMMIT antes de começar).
+    """
+    with app.open_resource('schema.sql') as f:
+        script = f.read().decode('utf8')
+    statements, pending = [], ''
+    for line in script.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            statements.append(pending.strip())
+            pending = ''
+    return statements
+
+
+def apply_schema(db):
+    """Cria o que falta do schema.sql (tabelas, índices, triggers); não apaga nada."""
+    for statement in schema_statements():
+        db.execute(statement)
+
+
+def _table_columns(db, table):
+    return {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+
+
+# Colunas que o schema original não tinha, adicionadas pela migração 1 às tabelas
+# já existentes (as NOT NULL precisam de um DEFAULT para o ALTER TABLE).
+LEGACY_ADDED_COLUMNS = {
+    'donors': (
+        ('identity_key', "TEXT NOT NULL DEFAULT ''"),
+        ('contact_key', 'TEXT'),
+        ('contact_search', 'TEXT'),
+        ('display_status', "TEXT NOT NULL DEFAULT ''"),
+    ),
+    'export_jobs': (
+        ('format', "TEXT NOT NULL DEFAULT 'xlsx'"),
+        ('options', "TEXT NOT NULL DEFAULT '{}'"),
+    ),
+}
+MIGRATION_BATCH_SIZE = 5000
+
+
+def _backfill_donor_keys(db):
+    """Calcula identidade, contato normalizado, texto da busca e status efetivo de cada doador."""
+    last_id = 0
+    while True:
+        rows = db.execute(
+            """
+            SELECT id, name, birth_date, contact_info, triage_result_status, calculated_next_donation_date
+            FROM donors WHERE id > ? ORDER BY id LIMIT ?
+            """,
+            (last_id, MIGRATION_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+        db.executemany(
+            """
+            UPDATE donors SET identity_key = ?, contact_key = ?, contact_search = ?, display_status = ?
+            WHERE id = ?
+            """,
+            [
+                (
+                    donor_identity_key(row[1], row[2]), normalize_contact(row[3]), search_contact_text(row[3]),
+                    compute_display_status(row[4], row[5]), row[0]
+                )
+                for row in rows
+            ]
+        )
+        last_id = rows[-1][0]
+
+
+def _merge_duplicate_donors(db):
+    """Junta os cadastros repetidos de um mesmo doador (mesma identity_key).
+
+    Fica a linha mais recente (a última triagem), com a data do primeiro cadastro
+    e, se ela não tiver, o último contato e a última data de doação informados,
+    como no UPSERT do cadastro. Todas as linhas, inclusive as removidas, vão para
+    a tabela temporária migration_visits, que vira o histórico de comparecimentos,
+    e as de cada grupo repetido, como estavam antes da união, para migration_merged,
+    que _migrate_legacy_schema copia para donors_merged.
+    """
+    db.execute("CREATE INDEX migration_donors_identity ON donors (identity_key, id)")
+    db.execute(
+        """
+        CREATE TEMP TABLE migration_visits AS
+        SELECT d.id AS source_id,
+               (SELECT MAX(k.id) FROM donors k WHERE k.identity_key = d.identity_key) AS donor_id,
+               d.registration_date AS visit_date, d.weight, d.last_donation_date, d.triage_result_status,
+               d.triage_deferral_days, d.triage_message, d.calculated_next_donation_date
+        FROM donors d
+        """
+    )
+    db.execute(
+        """
+        CREATE TEMP TABLE migration_kept AS
+        SELECT MAX(id) AS id FROM donors GROUP BY identity_key HAVING COUNT(*) > 1
+        """
+    )
+    db.execute(
+        """
+        CREATE TEMP TABLE migration_merged AS
+        SELECT d.id AS source_id, kept.id AS merged_into, d.name, d.birth_date, d.weight, d.blood_type,
+               d.last_donation_date, d.contact_info, d.triage_result_status, d.triage_deferral_days,
+               d.triage_message, d.calculated_next_donation_date, d.registration_date
+        FROM temp.migration_kept kept
+        JOIN donors k ON k.id = kept.id
+        JOIN donors d ON d.identity_key = k.identity_key
+        """
+    )
+    db.execute(
+        """
+        UPDATE donors AS kept SET registration_date = (
+            SELECT MIN(d.registration_date) FROM donors d WHERE d.identity_key = kept.identity_key
+        )
+        WHERE id IN (SELECT id FROM temp.migration_kept)
+        """
+    )
+    db.execute(
+        """
+        UPDATE donors AS kept SET (contact_info, contact_key, contact_search) = (
+            SELECT d.contact_info, d.contact_key, d.contact_search FROM donors d
+            WHERE d.identity_key = kept.identity_key AND d.contact_info IS NOT NULL
+            ORDER BY d.id DESC LIMIT 1
+        )
+        WHERE contact_info IS NULL AND id IN (SELECT id FROM temp.migration_kept)
+        """
+    )
+    db.execute(
+        """
+        UPDATE donors AS kept SET last_donation_date = (
+            SELECT d.last_donation_date FROM donors d
+            WHERE d.identity_key = kept.identity_key AND d.last_donation_date IS NOT NULL
+            ORDER BY d.id DESC LIMIT 1
+        )
+        WHERE last_donation_date IS NULL AND id IN (SELECT id FROM temp.migration_kept)
+        """
+    )
+    merged = db.execute(
+        "DELETE FROM donors WHERE id NOT IN (SELECT MAX(id) FROM donors GROUP BY identity_key)"
+    ).rowcount
+    db.execute("DROP TABLE temp.migration_kept")
+    db.execute("DROP INDEX migration_donors_identity")
+    return merged
+
+
+def _migrate_legacy_schema(db):
+    """Versão 1: banco criado antes das migrações (o schema original tinha só donors e users).
+
+    Também serve a bancos criados por versões intermediárias do schema.sql: os
+    triggers são recriados, e os dados derivados de donors (agregados, histórico,
+    índice de busca) são recalculados.
+    """
+    # Sem triggers durante os acertos em donors: tudo o que eles mantêm é recalculado no fim.
+    for (trigger,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+        db.execute(f"DROP TRIGGER {trigger}")
+    for table, columns in LEGACY_ADDED_COLUMNS.items():
+        existing = _table_columns(db, table)
+        for column, declaration in columns:
+            if existing and column not in existing:
+                db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    _backfill_donor_keys(db)
+    merged = _merge_duplicate_donors(db)
+    apply_schema(db)
+    # Um comparecimento por cadastro antigo, para doadores ainda sem histórico.
+    db.execute(
+        """
+        INSERT INTO donations (donor_id, visit_date, weight, last_donation_date, triage_result_status,
+                               triage_deferral_days, triage_message, calculated_next_donation_date)
+        SELECT donor_id, visit_date, weight, last_donation_date, triage_result_status,
+               triage_deferral_days, triage_message, calculated_next_donation_date
+        FROM temp.migration_visits v
+        WHERE NOT EXISTS (SELECT 1 FROM donations h WHERE h.donor_id = v.donor_id)
+        ORDER BY visit_date, source_id
+        """
+    )
+    db.execute("DROP TABLE temp.migration_visits")
+    db.execute(
+        """
+        INSERT INTO donors_merged (source_id, merged_into, name, birth_date, weight, blood_type, last_donation_date,
+                                   contact_info, triage_result_status, triage_deferral_days, triage_message,
+                                   calculated_next_donation_date, registration_date)
+        SELECT source_id, merged_into, name, birth_date, weight, blood_type, last_donation_date,
+               contact_info, triage_result_status, triage_deferral_days, triage_message,
+               calculated_next_donation_date, registration_date
+        FROM temp.migration_merged
+        """
+    )
+    db.execute("DROP TABLE temp.migration_merged")
+    rebuild_donor_stats(db)
+    rebuild_donor_search(db)
+    if merged:
+        app.logger.info(
+            f"Migração do schema: {merged} cadastro(s) repetido(s) unido(s) ao doador; "
+            "as linhas originais ficam em donors_merged."
+        )
+
+
+# Migração i leva o banco da versão i para i + 1. Para mudar o schema: altere o
+# schema.sql (bancos novos) e acrescente aqui a migração dos bancos existentes.
+SCHEMA_MIGRATIONS = (
+    _migrate_legacy_schema,
+)
+SCHEMA_VERSION = len(SCHEMA_MIGRATIONS)
+
+
+def migrate_db(db):
+    """Leva o banco à versão SCHEMA_VERSION. Retorna a versão anterior."""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"O banco está na versão {version} do schema, mais nova que a desta aplicação ({SCHEMA_VERSION})."
+            )
+        if version < SCHEMA_VERSION:
+            if not _table_columns(db, 'donors'):
+                apply_schema(db)  # banco novo (vazio)
+            else:
+                for migration in SCHEMA_MIGRATIONS[version:]:
+                    migration(db)
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return version
+
 
 def init_db():
+    """Apaga as tabelas do schema e cria o banco do zero (flask init-db)."""
     db = get_db()
-    with current_app.open_resource('schema.sql') as f:
-        db.executescript(f.read().decode('utf8'))
-    print("Banco de dados inicializado com schema (incluindo tabela users e coluna is_admin).")
+    tables = [
+        match.group(1) for match in
+        (re.search(r"^CREATE (?:VIRTUAL )?TABLE IF NOT EXISTS (\w+)", statement, re.M) for statement in schema_statements())
+        if match
+    ]
+    for table in reversed(tables):
+        db.execute(f"DROP TABLE IF EXISTS {table}")
+    db.execute("PRAGMA user_version = 0")
+    db.commit()
+    migrate_db(db)
+    print(f"Banco de dados criado do zero (schema versão {SCHEMA_VERSION}).")
 
 @app.cli.command('init-db')
 def init_db_command():
     """Limpa os dados existentes e cria novas tabelas."""
     init_db()
 
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """Aplica as migrações pendentes do schema, sem apagar dados."""
+    previous = migrate_db(get_db())
+    if previous == SCHEMA_VERSION:
+        print(f"Banco já está na versão {SCHEMA_VERSION} do schema.")
+    else:
+        print(f"Banco migrado da versão {previous} para a {SCHEMA_VERSION} do schema.")
+
 
 # --- Rotas de Autenticação ---
 @app.route('/register', methods=['GET', 'POST'])
@@ -120,8 +999,14 @@ def register():
             flash('Este CPF já está cadastrado.', 'error')
             return redirect(url_for('register'))
 
-        password_h = generate_password_hash(password)
-        
+        retry_after = login_ip_limiter.consume(request.remote_addr)
+        if retry_after:
+            return throttled_response('register.html', retry_after)
+        try:
+            password_h = password_hasher.hash(password)
+        except PasswordHashBusy:
+            return throttled_response('register.html', 0, 503)
+
         try:
             db.execute(
                 'INSERT INTO users (full_name, cpf, birth_date_user, username, password_hash) VALUES (?, ?, ?, ?, ?)',
@@ -155,15 +1040,34 @@ def login():
             flash('Usuário e senha são obrigatórios!', 'error')
             return redirect(url_for('login'))
 
+        # Limites conferidos antes de qualquer hash: por IP, toda tentativa gasta
+        # uma ficha; por usuário, só as senhas erradas (abaixo).
+        retry_after = (
+            login_ip_limiter.consume(request.remote_addr)
+            or login_user_limiter.consume(username, dry_run=True)
+        )
+        if retry_after:
+            return throttled_response('login.html', retry_after)
+
         db = get_db()
         user_data = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
 
-        if user_data and check_password_hash(user_data['password_hash'], password):
+        valid, new_hash = False, None
+        if user_data:
+            try:
+                valid, new_hash = password_hasher.verify(user_data['password_hash'], password)
+            except PasswordHashBusy:
+                return throttled_response('login.html', 0, 503)
+
+        if valid:
+            if new_hash:
+                # Hash de um método ou parâmetros antigos: refeito com PASSWORD_HASH_METHOD.
+                set_user_password_hash(db, user_data['id'], new_hash)
             user_obj = User(
                 id=user_data['id'], 
                 username=user_data['username'], 
                 full_name=user_data['full_name'], 
-                password_hash=user_data['password_hash'],
+                password_hash=new_hash or user_data['password_hash'],
                 is_admin=bool(user_data['is_admin']) 
             )
             login_user(user_obj) 
@@ -173,6 +1077,7 @@ def login():
             else:
                  return redirect(url_for('index'))
         else:
+            login_user_limiter.consume(username)
             flash('Usuário ou senha inválidos.', 'error')
             return redirect(url_for('login'))
     return render_template('login.html')
@@ -186,303 +1091,2164 @@ def logout():
     return redirect(url_for('login'))
 
 
+@app.cli.command('set-admin')
+@click.argument('username')
+@click.option('--revoke', is_flag=True, help='Remove o acesso de administrador.')
+def set_admin_command(username, revoke):
+    """Concede (ou remove, com --revoke) o acesso de administrador a um usuário."""
+    db = get_db()
+    user_data = db.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+    if not user_data:
+        raise click.ClickException(f"Usuário não encontrado: {username}")
+    set_user_admin(db, user_data['id'], not revoke)
+    print(f"Usuário {username} {'não é mais' if revoke else 'agora é'} administrador. "
+          f"Workers em execução aplicam a mudança em até {app.config['USER_CACHE_TTL']} s.")
+
+
+@app.route('/api/admin/user-cache')
+@login_required 
+def user_cache_stats():
+    if not current_user.is_admin:
+        return jsonify({"error": "Acesso restrito a administradores."}), 403
+    return jsonify(user_cache.stats())
+
+
 # --- Lógica de Triagem ---
-def perform_triage(data):
-    today = date.today()
-    messages = []
-    deferral_days = 0
-    overall_status = "apto" 
+# As regras (idades, peso, perguntas do questionário e prazos de espera) ficam em
+# uma tabela declarativa (TRIAGE_RULES_PATH, por padrão triage_rules.json). A
+# tabela é compilada uma vez em um TriageEngine e recarregada automaticamente
+# quando o arquivo muda, sem precisar reiniciar a aplicação.
+def _parse_form_date(value):
+    """Equivalente a datetime.strptime(value, '%Y-%m-%d').date(), com atalho para AAAA-MM-DD."""
+    if type(value) is str and len(value) == 10 and value[4] == '-' and value[7] == '-' and value.isascii():
+        year, month, day = value[:4], value[5:7], value[8:]
+        if year.isdigit() and month.isdigit() and day.isdigit():
+            return date(int(year), int(month), int(day))
+    return datetime.strptime(value, '%Y-%m-%d').date()
 
-    try:
-        birth_date_obj = datetime.strptime(data.get('birthDate'), '%Y-%m-%d').date()
-        age = today.year - birth_date_obj.year - ((today.month, today.day) < (birth_date_obj.month, birth_date_obj.day))
-        if not (16 <= age <= 69):
-            messages.append(f"Idade ({age} anos) fora do permitido (16-69 anos).")
-            overall_status = "inapto_permanente" 
-        elif age > 60 and not data.get('lastDonationDate'): 
-             if age > 60: 
-                messages.append("Primeira doação não permitida acima de 60 anos.")
-                overall_status = "inapto_permanente"
-    except (ValueError, TypeError):
-        messages.append("Data de nascimento inválida.")
-        return "inapto_permanente", "Data de nascimento inválida.", 0, None
 
-    try:
-        weight = float(str(data.get('weight', '0')).replace(',', '.'))
-        if weight < 50:
-            messages.append("Peso inferior a 50kg.")
-            overall_status = "inapto_permanente" 
-    except ValueError:
-        messages.append("Valor de peso inválido.")
-        overall_status = "inapto_permanente"
-
-    if overall_status != "inapto_permanente":
-        if data.get('feverFlu') == 'yes':
-            messages.append("Febre/gripe nos últimos 7 dias. Aguardar 7 dias após o fim dos sintomas.")
-            deferral_days = max(deferral_days, 7) 
-            overall_status = "inapto_temporario"
-        if data.get('tattooPiercing') == 'yes':
-            messages.append("Tatuagem/piercing nos últimos 6 meses. Aguardar 6 meses.")
-            deferral_days = max(deferral_days, 180) 
-            overall_status = "inapto_temporario"
-        if data.get('hepatitis') == 'yes': 
-            messages.append("Hepatite após os 11 anos é um impedimento definitivo.")
-            overall_status = "inapto_permanente"
-        if data.get('stdPositive') == 'yes': 
-            messages.append("Teste positivo para HIV, HTLV, Sífilis ou Hepatite B/C é impedimento definitivo.")
-            overall_status = "inapto_permanente"
-        if data.get('injectedDrugs') == 'yes':
-            messages.append("Uso de drogas injetáveis é impedimento definitivo.")
-            overall_status = "inapto_permanente"
-        if data.get('pregnantBreastfeeding') == 'yes':
-            messages.append("Gestantes ou lactantes (bebê < 12 meses) não podem doar.")
-            deferral_days = max(deferral_days, 365) 
-            overall_status = "inapto_temporario"
-        
-    last_donation_str = data.get('lastDonationDate')
-    min_interval_days = 90 
+class TriageEngine:
+    """Avaliador de triagem compilado a partir da tabela de regras.
+
+    `evaluate` devolve a mesma tupla (status, mensagem, dias_inapto, proxima_data)
+    que a triagem sempre devolveu; `evaluate_many` avalia um lote inteiro
+    calculando uma só vez o que depende da data de hoje.
+    """
+
+    def __init__(self, rules):
+        try:
+            invalid_birth = rules['invalid_birth_date']
+            self.invalid_birth_status = invalid_birth['status']
+            self.invalid_birth_message = invalid_birth['message']
+
+            age = rules['age']
+            self.min_age, self.max_age = int(age['min']), int(age['max'])
+            self.age_status = age['status']
+            self.age_message = age['message']
+
+            first_donation = rules['first_donation']
+            self.first_donation_max_age = int(first_donation['max_age'])
+            self.first_donation_status = first_donation['status']
+            self.first_donation_message = first_donation['message'].format(max_age=self.first_donation_max_age)
+
+            weight = rules['weight']
+            self.min_weight = float(weight['min'])
+            self.weight_status = weight['status']
+            self.weight_message = weight['message'].format(min=weight['min'])
+            self.weight_invalid_message = weight['invalid_message']
+
+            questionnaire = rules['questionnaire']
+            self.questionnaire_skip_statuses = frozenset(questionnaire.get('skip_if_status', ()))
+            self.questionnaire = tuple(
+                (rule['field'], rule['equals'], rule['status'], int(rule.get('deferral_days', 0)), rule['message'])
+                for rule in questionnaire['rules']
+            )
+
+            interval = rules['donation_interval']
+            self.min_interval_days = int(interval['min_days'])
+            self.min_interval = timedelta(days=self.min_interval_days)
+            self.interval_status = interval['status']
+            self.interval_message = interval['message']
+            self.interval_invalid_message = interval['invalid_message']
+
+            messages = rules['messages']
+            self.message_prefix = messages['prefix']
+            self.message_separator = messages['separator']
+            self.no_findings_message = messages['no_findings']
+            self.apto_message = messages['apto']
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Tabela de regras de triagem inválida: {e!r}") from e
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf8') as f:
+            return cls(json.load(f))
+
+    def evaluate(self, data, today=None):
+        today = today or date.today()
+        return self._evaluate(data, today, today + self.min_interval, _parse_form_date)
+
+    def evaluate_many(self, rows, today=None):
+        """Avalia um lote de candidatos; datas repetidas no lote são convertidas uma só vez."""
+        today = today or date.today()
+        next_apto_date = today + self.min_interval
+        parsed_dates = {}
+
+        def parse_date(value):
+            try:
+                return parsed_dates[value]
+            except KeyError:
+                parsed = parsed_dates[value] = _parse_form_date(value)
+                return parsed
+
+        return [self._evaluate(data, today, next_apto_date, parse_date) for data in rows]
+
+    def _evaluate(self, data, today, next_apto_date, parse_date):
+        messages = []
+        deferral_days = 0
+        overall_status = "apto"
+
+        try:
+            birth_date_obj = parse_date(data.get('birthDate'))
+        except (ValueError, TypeError):
+            return self.invalid_birth_status, self.invalid_birth_message, 0, None
+        age = today.year - birth_date_obj.year - ((today.month, today.day) < (birth_date_obj.month, birth_date_obj.day))
+        if not (self.min_age <= age <= self.max_age):
+            messages.append(self.age_message.format(age=age, min=self.min_age, max=self.max_age))
+            overall_status = self.age_status
+        elif age > self.first_donation_max_age and not data.get('lastDonationDate'):
+            messages.append(self.first_donation_message)
+            overall_status = self.first_donation_status
 
-    if last_donation_str:
         try:
-            last_donation_obj = datetime.strptime(last_donation_str, '%Y-%m-%d').date()
-            days_since_last_donation = (today - last_donation_obj).days
-            if days_since_last_donation < min_interval_days:
-                remaining_days = min_interval_days - days_since_last_donation
-                messages.append(f"Ainda faltam {remaining_days} dias desde a última doação (intervalo mínimo {min_interval_days} dias).")
-                deferral_days = max(deferral_days, remaining_days)
-                overall_status = "inapto_temporario"
+            weight = float(str(data.get('weight', '0')).replace(',', '.'))
+            if weight < self.min_weight:
+                messages.append(self.weight_message)
+                overall_status = self.weight_status
         except ValueError:
-            messages.append("Data da última doação inválida.")
+            messages.append(self.weight_invalid_message)
+            overall_status = self.weight_status
 
-    final_message = "Triagem concluída. " + (" | ".join(messages) if messages else "Nenhum impedimento direto encontrado nas questões básicas.")
-    if overall_status == "apto" and not messages:
-        final_message = "Preliminarmente Apto para doação!"
+        if overall_status not in self.questionnaire_skip_statuses:
+            for field, expected, rule_status, rule_deferral_days, message in self.questionnaire:
+                if data.get(field) == expected:
+                    messages.append(message)
+                    deferral_days = max(deferral_days, rule_deferral_days)
+                    overall_status = rule_status
 
-    calculated_next_date = None
-    if overall_status == "apto":
-        calculated_next_date = today + timedelta(days=min_interval_days) 
+        last_donation_str = data.get('lastDonationDate')
+        last_donation_obj = None
         if last_donation_str:
             try:
-                last_donation_obj = datetime.strptime(last_donation_str, '%Y-%m-%d').date()
-                calculated_next_date = max(calculated_next_date, last_donation_obj + timedelta(days=min_interval_days))
-            except ValueError: pass
-    elif overall_status == "inapto_temporario":
-        if deferral_days > 0 : 
-            calculated_next_date = today + timedelta(days=deferral_days)
-    return overall_status, final_message, deferral_days, calculated_next_date.isoformat() if calculated_next_date else None
+                last_donation_obj = parse_date(last_donation_str)
+            except ValueError:
+                messages.append(self.interval_invalid_message)
+            else:
+                days_since_last_donation = (today - last_donation_obj).days
+                if days_since_last_donation < self.min_interval_days:
+                    remaining_days = self.min_interval_days - days_since_last_donation
+                    messages.append(self.interval_message.format(remaining=remaining_days, min_days=self.min_interval_days))
+                    deferral_days = max(deferral_days, remaining_days)
+                    overall_status = self.interval_status
 
+        final_message = self.message_prefix + (self.message_separator.join(messages) if messages else self.no_findings_message)
+        if overall_status == "apto" and not messages:
+            final_message = self.apto_message
 
-# --- Rotas Principais da Aplicação (Doadores) ---
-@app.route('/')
-@login_required 
-def index():
-    return render_template('index.html') 
+        calculated_next_date = None
+        if overall_status == "apto":
+            calculated_next_date = next_apto_date
+            if last_donation_obj is not None:
+                calculated_next_date = max(calculated_next_date, last_donation_obj + self.min_interval)
+        elif overall_status == "inapto_temporario":
+            if deferral_days > 0:
+                calculated_next_date = today + timedelta(days=deferral_days)
+        return overall_status, final_message, deferral_days, calculated_next_date.isoformat() if calculated_next_date else None
 
-@app.route('/api/donors', methods=['POST'])
-@login_required 
-def add_donor():
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "Nenhum dado enviado"}), 400
 
-    required_fields = ['donorName', 'birthDate', 'weight', 'bloodType']
-    for field in required_fields:
-        if field not in data or not data[field]:
-            return jsonify({"error": f"Campo obrigatório ausente: {field}"}), 400
+_triage_engine = None
+_triage_rules_mtime = None
+_triage_rules_checked_at = 0.0
 
-    triage_status, triage_msg, deferral_d, next_donation_calc = perform_triage(data)
+def get_triage_engine():
+    """Devolve o TriageEngine atual, recompilando se o arquivo de regras mudou.
 
-    db = get_db()
+    O arquivo é verificado no máximo a cada TRIAGE_RULES_CHECK_INTERVAL segundos.
+    Se a nova versão for inválida, o erro é registrado e as regras anteriores
+    continuam valendo.
+    """
+    global _triage_engine, _triage_rules_mtime, _triage_rules_checked_at
+    now = time.monotonic()
+    if _triage_engine is not None and now - _triage_rules_checked_at < app.config['TRIAGE_RULES_CHECK_INTERVAL']:
+        return _triage_engine
+    _triage_rules_checked_at = now
+
+    path = app.config['TRIAGE_RULES_PATH']
     try:
-        cursor = db.cursor()
-        cursor.execute(
-            """
-            INSERT INTO donors (
-                name, birth_date, weight, blood_type, last_donation_date, contact_info,
-                triage_result_status, triage_deferral_days, triage_message, calculated_next_donation_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                data.get('donorName'), data.get('birthDate'), float(str(data.get('weight','0')).replace(',','.')),
-                data.get('bloodType'), data.get('lastDonationDate') or None, data.get('contactInfo') or None,
-                triage_status, deferral_d if triage_status == 'inapto_temporario' and deferral_d > 0 else None,
-                triage_msg, next_donation_calc
-            )
-        )
-        db.commit()
-        new_donor_id = cursor.lastrowid
-    except sqlite3.Error as e:
-        db.rollback()
-        current_app.logger.error(f"Erro de banco de dados: {e}")
-        return jsonify({"error": "Erro ao salvar doador no banco de dados", "details": str(e)}), 500
+        mtime = os.stat(path).st_mtime_ns
+        if mtime != _triage_rules_mtime or _triage_engine is None:
+            _triage_engine = TriageEngine.from_file(path)
+            _triage_rules_mtime = mtime
+    except (OSError, ValueError) as e:
+        if _triage_engine is None:
+            raise
+        app.logger.error(f"Erro ao recarregar as regras de triagem ({path}); mantendo as anteriores: {e}")
+    return _triage_engine
 
-    return jsonify({
-        "message": "Doador processado com sucesso!",
-        "id": new_donor_id,
-        "triage_status": triage_status,
-        "triage_message": triage_msg,
-        "deferral_days": deferral_d,
-        "calculated_next_donation_date": next_donation_calc
-    }), 201
 
+def perform_triage(data):
+    with metrics_phase('triage'):
+        return get_triage_engine().evaluate(data)
 
-@app.route('/api/donors', methods=['GET'])
-@login_required 
-def get_donors():
-    db = get_db()
-    cursor = db.execute('SELECT * FROM donors ORDER BY registration_date DESC')
-    donors_list = [dict(row) for row in cursor.fetchall()]
 
-    today_date = date.today()
-    for donor in donors_list:
-        display_status = donor['triage_result_status']
-        if donor['calculated_next_donation_date']:
-            try:
-                next_date_str = donor['calculated_next_donation_date']
-                next_date_obj = None
-                if isinstance(next_date_str, str):
-                    next_date_obj = date.fromisoformat(next_date_str)
-                elif isinstance(next_date_str, date): 
-                    next_date_obj = next_date_str
-                
-                if next_date_obj:
-                    if donor['triage_result_status'] == 'inapto_temporario' and next_date_obj <= today_date:
-                        display_status = 'apto_pos_espera'
-                    elif donor['triage_result_status'] == 'apto' and next_date_obj > today_date:
-                        display_status = 'aguardando_intervalo'
-            except (ValueError, TypeError) as e:
-                current_app.logger.error(f"Erro ao processar data em get_donors: {e} para valor {donor['calculated_next_donation_date']}")
-                pass 
-        donor['display_status'] = display_status
-    
-    return jsonify(donors_list)
+def perform_triage_batch(rows):
+    with metrics_phase('triage_batch'):
+        return get_triage_engine().evaluate_many(rows)
 
+# Compila as regras já na carga do módulo, para falhar cedo se o arquivo for inválido.
+get_triage_engine()
 
-@app.route('/api/donors/spreadsheet')
-@login_required 
-def generate_spreadsheet():
-    if not current_user.is_admin:
-        flash('Acesso negado. Esta funcionalidade é restrita a administradores.', 'error')
-        return redirect(url_for('index'))
 
-    db = get_db()
-    cursor = db.execute('SELECT * FROM donors ORDER BY name ASC')
-    donors_data = [dict(row) for row in cursor.fetchall()]
-
-    wb = openpyxl.Workbook()
-    sheet = wb.active
-    sheet.title = "Controle de Doações Sangria"
-
-    # --- INÍCIO DAS MODIFICAÇÕES PARA ADICIONAR contact_info ---
-    headers = [
-        "ID", "Nome", "Data Nasc.", "Peso (kg)", "Tipo Sanguíneo", 
-        "Email/Telefone", # << NOVO CABEÇALHO ADICIONADO
-        "Última Doação", "Status Triagem", "Dias Inapto", "Mensagem Triagem", 
-        "Próxima Data Possível", "Data Cadastro"
-    ]
-    # --- FIM DAS MODIFICAÇÕES PARA ADICIONAR contact_info ---
-    sheet.append(headers)
-
-    fill_apto = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    font_apto = Font(color="006100", bold=True)
-    fill_espera = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
-    font_espera = Font(color="9C5700", bold=True)
-    fill_inapto_temp = PatternFill(start_color="FFD1D1", end_color="FFD1D1", fill_type="solid") 
-    font_inapto_temp = Font(color="9C0006", bold=True)
-    fill_inapto_perm = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    font_inapto_perm = Font(color="9C0006", bold=True, italic=True)
-    
-    alignment_center = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    alignment_left = Alignment(horizontal='left', vertical='center', wrap_text=True)
+@app.cli.command('check-triage')
+@click.option('--rules', 'rules_path', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Arquivo de regras a verificar (padrão: TRIAGE_RULES_PATH).')
+@click.option('--golden', 'golden_path', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Corpus de referência (padrão: triage_golden.json).')
+def check_triage_command(rules_path, golden_path):
+    """Confere o motor de triagem contra o corpus de respostas de referência."""
+    engine = TriageEngine.from_file(rules_path or app.config['TRIAGE_RULES_PATH'])
+    with open(golden_path or os.path.join(project_root, 'triage_golden.json'), encoding='utf8') as f:
+        corpus = json.load(f)
 
-    for col_num, header_title in enumerate(headers, 1):
-        cell = sheet.cell(row=1, column=col_num)
-        cell.font = Font(bold=True)
-        cell.alignment = alignment_center
-        column_letter = get_column_letter(col_num)
-        if header_title == "Mensagem Triagem":
-            sheet.column_dimensions[column_letter].width = 50
-        # MODIFICADO: Adicionado "Email/Telefone" à lista de colunas com largura 25
-        elif header_title in ["Nome", "Próxima Data Possível", "Data Cadastro", "Email/Telefone"]: 
-            sheet.column_dimensions[column_letter].width = 25
-        else:
-            sheet.column_dimensions[column_letter].width = 15
+    failures = 0
+    for case in corpus:
+        result = list(engine.evaluate(case['input'], date.fromisoformat(case['today'])))
+        if result != case['expected']:
+            failures += 1
+            print(f"Divergência (hoje={case['today']}): {case['input']}\n  esperado: {case['expected']}\n  obtido:   {result}")
+    print(f"{len(corpus) - failures}/{len(corpus)} casos conferem.")
+    if failures:
+        raise SystemExit(1)
 
-    for donor in donors_data:
-        birth_d = donor['birth_date']
-        last_d = donor['last_donation_date'] if donor['last_donation_date'] else '-'
-        next_d = donor['calculated_next_donation_date'] if donor['calculated_next_donation_date'] else '-'
-        
-        # ADICIONADO: Pega o dado de contato
-        contact = donor['contact_info'] if donor['contact_info'] else '-' 
 
-        registration_value = donor['registration_date'] 
-        if isinstance(registration_value, datetime):  
-            reg_d = registration_value.strftime('%d/%m/%Y %H:%M')
-        elif isinstance(registration_value, str):  
-            try:
-                reg_d = datetime.fromisoformat(registration_value).strftime('%d/%m/%Y %H:%M')
-            except ValueError: 
-                reg_d = registration_value 
-        else:
-            reg_d = '-' 
-
-        # MODIFICADO: Adicionado 'contact' à lista de dados da linha
-        row_data = [
-            donor['id'], donor['name'], birth_d, donor['weight'], donor['blood_type'],
-            contact, # << DADO DE CONTATO ADICIONADO
-            last_d, donor['triage_result_status'], 
-            donor['triage_deferral_days'] if donor['triage_deferral_days'] else '-',
-            donor['triage_message'], next_d, reg_d
-        ]
-        sheet.append(row_data)
-        
-        # Lógica de status_cell_idx e alinhamento precisa ser robusta à nova coluna
-        try:
-            status_cell_idx = headers.index("Status Triagem") + 1
-            # ADICIONADO: Índice para a nova coluna de contato para alinhamento (ou certifique-se que a lógica de alinhamento abaixo lida com isso)
-            contact_cell_idx = headers.index("Email/Telefone") + 1 
-        except ValueError: 
-            status_cell_idx = -1 
-            contact_cell_idx = -1 # Se o header não for encontrado, não tentaremos alinhar
-            
-        status_val = (donor['triage_result_status'] or "").lower() 
-        
-        current_row = sheet.max_row
-        for col_idx in range(1, len(headers) + 1):
-            cell = sheet.cell(row=current_row, column=col_idx)
-            # Lógica de alinhamento MODIFICADA para incluir a nova coluna de contato
-            # As colunas que queremos centralizadas: ID, Peso (kg), Dias Inapto
-            # As outras (Nome, Data Nasc., Tipo Sanguíneo, Email/Telefone, Última Doação, Status, Mensagem, Próxima Data, Data Cadastro) à esquerda
-            if headers[col_idx-1] in ["ID", "Peso (kg)", "Dias Inapto"]:
-                 cell.alignment = alignment_center
+# --- Status Efetivo (display_status) ---
+# O status exibido depende da data de hoje: um inapto temporário cuja espera já
+# terminou vira 'apto_pos_espera' e um apto ainda dentro do intervalo mínimo fica
+# 'aguardando_intervalo'. O valor é gravado na tabela donors no cadastro e a
+# transição diária só atualiza as linhas cuja data chegou.
+def compute_display_status(triage_status, next_donation_date, today=None):
+    if not next_donation_date:
+        return triage_status
+    today_iso = (today or date.today()).isoformat()
+    if triage_status == 'inapto_temporario' and next_donation_date <= today_iso:
+        return 'apto_pos_espera'
+    elif triage_status == 'apto' and next_donation_date > today_iso:
+        return 'aguardando_intervalo'
+    return triage_status
+
+
+def refresh_display_status(db, today=None):
+    """Aplica as transições de status cuja data chegou. Retorna quantas linhas mudaram."""
+    today_iso = (today or date.today()).isoformat()
+    changed = db.execute(
+        """
+        UPDATE donors SET display_status = 'apto_pos_espera'
+        WHERE display_status = 'inapto_temporario' AND calculated_next_donation_date <= ?
+        """,
+        (today_iso,)
+    ).rowcount
+    changed += db.execute(
+        """
+        UPDATE donors SET display_status = 'apto'
+        WHERE display_status = 'aguardando_intervalo' AND calculated_next_donation_date <= ?
+        """,
+        (today_iso,)
+    ).rowcount
+    # Datas que já passaram ficam zeradas no calendário de liberação (GET /api/stats).
+    db.execute(
+        "DELETE FROM donor_eligibility_calendar WHERE eligible_date <= ? AND total <= 0",
+        (today_iso,)
+    )
+    db.commit()
+    return changed
+
+
+def prune_donor_changes(db):
+    """Remove do registro de alterações (feed SSE) o que passou da retenção."""
+    pruned = db.execute(
+        "DELETE FROM donor_changes WHERE changed_at < datetime('now', ?)",
+        (f"-{int(app.config['DONOR_CHANGES_RETENTION_DAYS'])} days",)
+    ).rowcount
+    db.commit()
+    return pruned
+
+
+# Data da última transição aplicada por este processo; a primeira requisição de
+# cada dia executa a transição (as demais encontram o status já atualizado).
+_status_refreshed_on = None
+
+@app.before_request
+def ensure_display_status_fresh():
+    global _status_refreshed_on
+    today = date.today()
+    if _status_refreshed_on == today:
+        return
+    try:
+        db = get_db()
+        changed = refresh_display_status(db, today)
+        prune_donor_changes(db)
+    except sqlite3.Error as e:
+        current_app.logger.error(f"Erro na transição diária de status: {e}")
+        return
+    _status_refreshed_on = today
+    if changed:
+        current_app.logger.info(f"Transição diária de status: {changed} doador(es) atualizados.")
+
+@app.cli.command('refresh-status')
+def refresh_status_command():
+    """Atualiza o status efetivo dos doadores cuja data de espera/intervalo chegou."""
+    db = get_db()
+    changed = refresh_display_status(db)
+    pruned = prune_donor_changes(db)
+    print(f"Status atualizado para {changed} doador(es); {pruned} registro(s) antigo(s) do feed removido(s).")
+
+
+# --- Rotas Principais da Aplicação (Doadores) ---
+@app.route('/')
+@login_required 
+def index():
+    return render_template('index.html') 
+
+DONOR_REQUIRED_FIELDS = ['donorName', 'birthDate', 'weight', 'bloodType']
+# Campos que entram na identidade do doador e no contato normalizado: precisam ser texto.
+DONOR_TEXT_FIELDS = ('donorName', 'birthDate', 'contactInfo')
+# Colunas de donors enviadas ao navegador (listagem e feed em tempo real). As
+# chaves internas (identity_key, contact_key, contact_search) ficam de fora.
+DONOR_PUBLIC_COLUMNS = (
+    "id", "name", "birth_date", "weight", "blood_type", "last_donation_date", "contact_info",
+    "triage_result_status", "triage_deferral_days", "triage_message", "calculated_next_donation_date",
+    "display_status", "registration_date",
+)
+
+
+def donor_field_type_error(data):
+    """Mensagem de erro se um dos DONOR_TEXT_FIELDS não for texto (JSON com número, lista...), senão None."""
+    for field in DONOR_TEXT_FIELDS:
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            return f"Campo inválido: {field} deve ser um texto."
+    return None
+
+
+# Identidade do doador: um doador que volta é reconhecido pelo nome normalizado +
+# data de nascimento (índice único idx_donors_identity) e atualiza a própria linha,
+# em vez de criar outra; cada triagem fica no histórico (tabela donations).
+def normalize_donor_name(name):
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    without_accents = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(without_accents.casefold().split())
+
+
+def donor_identity_key(name, birth_date):
+    return f"{normalize_donor_name(name)}|{(birth_date or '').strip()}"
+
+
+def normalize_contact(contact):
+    """E-mail em minúsculas ou só os dígitos do telefone (None se vazio)."""
+    contact = (contact or '').strip()
+    if not contact:
+        return None
+    if '@' in contact:
+        return contact.casefold()
+    digits = ''.join(ch for ch in contact if ch.isdigit())
+    return digits or contact.casefold()
+
+
+_LETTER_DIGIT_BOUNDARY = re.compile(r'(?<=[^\W\d_])(?=\d)|(?<=\d)(?=[^\W\d_])')
+
+
+def search_contact_text(contact):
+    """contact_info com letras e números separados por espaço (coluna contact_search).
+
+    O tokenizador do FTS5 junta letras e dígitos vizinhos: sem a separação,
+    "maria.silva84@gmail.com" viraria o termo "silva84".
+    """
+    contact = (contact or '').strip()
+    return _LETTER_DIGIT_BOUNDARY.sub(' ', contact) if contact else None
+
+
+# Cadastro ou retorno: no conflito de identidade, a linha existente recebe a nova
+# triagem. Data da última doação e contato só são substituídos quando informados.
+DONOR_UPSERT_SQL = """
+    INSERT INTO donors (
+        identity_key, name, birth_date, weight, blood_type, last_donation_date, contact_info, contact_key,
+        contact_search, triage_result_status, triage_deferral_days, triage_message,
+        calculated_next_donation_date, display_status
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (identity_key) DO UPDATE SET
+        name = excluded.name,
+        weight = excluded.weight,
+        blood_type = excluded.blood_type,
+        last_donation_date = COALESCE(excluded.last_donation_date, last_donation_date),
+        contact_info = COALESCE(excluded.contact_info, contact_info),
+        contact_key = COALESCE(excluded.contact_key, contact_key),
+        contact_search = COALESCE(excluded.contact_search, contact_search),
+        triage_result_status = excluded.triage_result_status,
+        triage_deferral_days = excluded.triage_deferral_days,
+        triage_message = excluded.triage_message,
+        calculated_next_donation_date = excluded.calculated_next_donation_date,
+        display_status = excluded.display_status
+"""
+
+
+def donor_upsert_params(data, triage, today=None):
+    """Parâmetros de DONOR_UPSERT_SQL para um doador já triado."""
+    triage_status, triage_msg, deferral_d, next_donation_calc = triage
+    contact_info = data.get('contactInfo') or None
+    return (
+        donor_identity_key(data.get('donorName'), data.get('birthDate')),
+        data.get('donorName'), data.get('birthDate'), float(str(data.get('weight','0')).replace(',','.')),
+        data.get('bloodType'), data.get('lastDonationDate') or None, contact_info, normalize_contact(contact_info),
+        search_contact_text(contact_info),
+        triage_status, deferral_d if triage_status == 'inapto_temporario' and deferral_d > 0 else None,
+        triage_msg, next_donation_calc, compute_display_status(triage_status, next_donation_calc, today)
+    )
+
+
+@app.route('/api/donors', methods=['POST'])
+@login_required 
+def add_donor():
+    data = request.get_json()
+    if not data or not isinstance(data, dict):
+        return jsonify({"error": "Nenhum dado enviado"}), 400
+
+    for field in DONOR_REQUIRED_FIELDS:
+        if field not in data or not data[field]:
+            return jsonify({"error": f"Campo obrigatório ausente: {field}"}), 400
+    type_error = donor_field_type_error(data)
+    if type_error:
+        return jsonify({"error": type_error}), 400
+
+    db = get_db()
+    existing = db.execute(
+        'SELECT id, last_donation_date FROM donors WHERE identity_key = ?',
+        (donor_identity_key(data.get('donorName'), data.get('birthDate')),)
+    ).fetchone()
+    if existing is not None and not data.get('lastDonationDate') and existing['last_donation_date']:
+        # Retorno sem a data informada: a triagem usa a última doação já registrada.
+        data = {**data, 'lastDonationDate': existing['last_donation_date']}
+
+    triage = perform_triage(data)
+    triage_status, triage_msg, deferral_d, next_donation_calc = triage
+
+    try:
+        with metrics_phase('donor_insert'):
+            donor_id = db.execute(DONOR_UPSERT_SQL + " RETURNING id", donor_upsert_params(data, triage)).fetchone()['id']
+            db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        current_app.logger.error(f"Erro de banco de dados: {e}")
+        return jsonify({"error": "Erro ao salvar doador no banco de dados", "details": str(e)}), 500
+
+    return jsonify({
+        "message": "Doador processado com sucesso!",
+        "id": donor_id,
+        "returning": existing is not None,
+        "triage_status": triage_status,
+        "triage_message": triage_msg,
+        "deferral_days": deferral_d,
+        "calculated_next_donation_date": next_donation_calc
+    }), 201
+
+
+DONOR_LOOKUP_VISITS = 5
+
+
+@app.route('/api/donors/lookup')
+@login_required 
+def lookup_donor():
+    """Busca um doador já cadastrado para preencher o formulário de um retorno.
+
+    Procura pela identidade (name + birth_date) e, se não encontrar, pelo contato;
+    as duas buscas usam índices, então o formulário pode chamar enquanto se digita.
+    """
+    name = request.args.get('name', '').strip()
+    birth_date = request.args.get('birth_date', '').strip()
+    contact_key = normalize_contact(request.args.get('contact'))
+    if not (name and birth_date) and not contact_key:
+        return jsonify({"error": "Informe name e birth_date, ou contact."}), 400
+
+    db = get_db(readonly=True)
+    donor = None
+    if name and birth_date:
+        donor = db.execute(
+            'SELECT * FROM donors WHERE identity_key = ?', (donor_identity_key(name, birth_date),)
+        ).fetchone()
+    if donor is None and contact_key:
+        donor = db.execute(
+            'SELECT * FROM donors WHERE contact_key = ? ORDER BY id DESC LIMIT 1', (contact_key,)
+        ).fetchone()
+    if donor is None:
+        return jsonify({"found": False})
+
+    visits = db.execute(
+        """
+        SELECT visit_date, weight, triage_result_status, triage_message, calculated_next_donation_date
+        FROM donations WHERE donor_id = ? ORDER BY id DESC LIMIT ?
+        """,
+        (donor['id'], DONOR_LOOKUP_VISITS)
+    ).fetchall()
+    visit_count = db.execute('SELECT COUNT(*) FROM donations WHERE donor_id = ?', (donor['id'],)).fetchone()[0]
+    return jsonify({
+        "found": True,
+        "donor": {
+            "id": donor['id'],
+            "name": donor['name'],
+            "birth_date": donor['birth_date'],
+            "blood_type": donor['blood_type'],
+            "display_status": donor['display_status'],
+            "calculated_next_donation_date": donor['calculated_next_donation_date'],
+            "registration_date": _timestamp_json(donor['registration_date']),
+        },
+        # Mesmas chaves do formulário de cadastro.
+        "prefill": {
+            "donorName": donor['name'],
+            "birthDate": donor['birth_date'],
+            "weight": donor['weight'],
+            "bloodType": donor['blood_type'],
+            "lastDonationDate": donor['last_donation_date'],
+            "contactInfo": donor['contact_info'],
+        },
+        "visit_count": visit_count,
+        "visits": [
+            {**dict(visit), "visit_date": _timestamp_json(visit['visit_date'])} for visit in visits
+        ],
+    })
+
+
+# --- Feed em Tempo Real (Server-Sent Events) ---
+# Em vez de recarregar a lista inteira, o painel recebe só os doadores cadastrados,
+# que voltaram ou com status alterado, lidos de donor_changes a partir do último
+# evento visto.
+def get_last_donor_change_id(db):
+    return db.execute('SELECT COALESCE(MAX(id), 0) FROM donor_changes').fetchone()[0]
+
+
+def _sse_message(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {current_app.json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.route('/api/donors/stream')
+@login_required 
+def donor_stream():
+    # Na reconexão o navegador envia Last-Event-ID; na primeira conexão o painel
+    # informa o last_event_id recebido junto com a listagem.
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    db = get_db(readonly=True)
+    try:
+        last_event_id = int(last_event_id)
+    except (TypeError, ValueError):
+        last_event_id = get_last_donor_change_id(db)
+
+    oldest = db.execute('SELECT MIN(id) FROM donor_changes').fetchone()[0]
+    reset_needed = oldest is not None and last_event_id < oldest - 1
+    if reset_needed:
+        # Os eventos entre o último visto e o mais antigo guardado já foram apagados.
+        last_event_id = get_last_donor_change_id(db)
+
+    poll_interval = app.config['SSE_POLL_INTERVAL']
+    heartbeat_interval = app.config['SSE_HEARTBEAT_INTERVAL']
+    batch_size = app.config['SSE_BATCH_SIZE']
+    donor_columns = ", ".join(f"d.{column}" for column in DONOR_PUBLIC_COLUMNS)
+
+    def generate():
+        cursor_id = last_event_id
+        yield "retry: 3000\n\n"
+        if reset_needed:
+            yield _sse_message('reset', {"last_event_id": cursor_id}, cursor_id)
+        deadline = time.monotonic() + app.config['SSE_MAX_DURATION']
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            rows = db.execute(
+                f"""
+                SELECT c.id AS event_id, c.kind AS change_kind, {donor_columns}
+                FROM donor_changes c JOIN donors d ON d.id = c.donor_id
+                WHERE c.id > ? ORDER BY c.id LIMIT ?
+                """,
+                (cursor_id, batch_size)
+            ).fetchall()
+            for row in rows:
+                donor = dict(row)
+                cursor_id = donor.pop('event_id')
+                donor['change'] = donor.pop('change_kind')
+                yield _sse_message('donor', donor, cursor_id)
+            if rows:
+                last_sent = time.monotonic()
+                if len(rows) == batch_size:
+                    continue
+            elif time.monotonic() - last_sent >= heartbeat_interval:
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Evita que proxies (ex.: nginx) segurem os eventos em buffer.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --- Importação em Lote (fichas de campanha em CSV/XLSX) ---
+# Cabeçalhos aceitos além das chaves da API (donorName, birthDate, ...): os mesmos
+# títulos usados na planilha exportada, para permitir reimportar um arquivo dela.
+IMPORT_COLUMN_ALIASES = {
+    "Nome": 'donorName',
+    "Data Nasc.": 'birthDate',
+    "Peso (kg)": 'weight',
+    "Tipo Sanguíneo": 'bloodType',
+    "Email/Telefone": 'contactInfo',
+    "Última Doação": 'lastDonationDate',
+}
+IMPORT_ANSWER_VALUES = {'sim': 'yes', 's': 'yes', 'não': 'no', 'nao': 'no', 'n': 'no'}
+IMPORT_DATE_FIELDS = ('birthDate', 'lastDonationDate')
+
+
+def _normalize_import_row(raw):
+    """Converte uma linha do arquivo no mesmo formato do JSON de POST /api/donors."""
+    data = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        key = IMPORT_COLUMN_ALIASES.get(key.strip(), key.strip())
+        if isinstance(value, datetime):
+            value = value.date().isoformat()
+        elif isinstance(value, date):
+            value = value.isoformat()
+        elif isinstance(value, (int, float)):
+            value = str(value)
+        elif isinstance(value, str):
+            value = value.strip()
+            if key not in IMPORT_DATE_FIELDS:
+                value = IMPORT_ANSWER_VALUES.get(value.lower(), value)
+        if value in ('', '-'):
+            value = None
+        data[key] = value
+    return data
+
+
+def iter_csv_rows(binary_stream):
+    """Lê um CSV (separado por vírgula ou ponto e vírgula) linha a linha."""
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    header_line = text.readline()
+    delimiter = ';' if header_line.count(';') > header_line.count(',') else ','
+    fieldnames = next(csv.reader([header_line], delimiter=delimiter), [])
+    for row in csv.DictReader(text, fieldnames=fieldnames, delimiter=delimiter):
+        yield _normalize_import_row(row)
+
+
+def iter_xlsx_rows(binary_stream):
+    """Lê a primeira aba de um XLSX em modo read-only (sem carregar o arquivo todo)."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(binary_stream, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        headers = [str(h) if h is not None else None for h in next(rows, ())]
+        for values in rows:
+            if all(v is None for v in values):
+                continue
+            yield _normalize_import_row(dict(zip(headers, values)))
+    finally:
+        wb.close()
+
+
+def iter_import_file(binary_stream, filename):
+    if (filename or '').lower().endswith('.xlsx'):
+        return iter_xlsx_rows(binary_stream)
+    return iter_csv_rows(binary_stream)
+
+
+def _validate_import_row(data):
+    for field in DONOR_REQUIRED_FIELDS:
+        if not data.get(field):
+            return f"Campo obrigatório ausente: {field}"
+    type_error = donor_field_type_error(data)
+    if type_error:
+        return type_error
+    try:
+        float(str(data['weight']).replace(',', '.'))
+    except ValueError:
+        return "Valor de peso inválido."
+    return None
+
+
+def _apply_stored_donation_dates(db, rows):
+    """Mesma regra de add_donor para um lote: no retorno sem data da última doação,
+    a triagem usa a já registrada.
+
+    Vale também para a mesma pessoa repetida no arquivo, que na segunda linha já
+    conta como retorno (com a data da primeira, se informada). Altera os dicts de `rows`.
+    """
+    keys = [donor_identity_key(data.get('donorName'), data.get('birthDate')) for data in rows]
+    known = {
+        row[0]: row[1] for row in db.execute(
+            "SELECT identity_key, last_donation_date FROM donors WHERE identity_key IN (SELECT value FROM json_each(?))",
+            (json.dumps(sorted(set(keys))),)
+        )
+    }
+    for key, data in zip(keys, rows):
+        if key in known and not data.get('lastDonationDate') and known[key]:
+            data['lastDonationDate'] = known[key]
+        known[key] = data.get('lastDonationDate') or known.get(key)
+
+
+def _insert_import_batch(db, batch, report):
+    """Tria e insere um lote em uma única transação; preenche o relatório por linha."""
+    today = date.today()
+    entries = []
+    valid = []
+    for row_number, data in batch:
+        error = _validate_import_row(data)
+        if error:
+            entries.append({"row": row_number, "status": "error", "error": error})
+        else:
+            entry = {"row": row_number, "status": "ok"}
+            entries.append(entry)
+            valid.append((entry, data))
+
+    _apply_stored_donation_dates(db, [data for _, data in valid])
+    pending = []
+    triages = perform_triage_batch([data for _, data in valid])
+    for (entry, data), triage in zip(valid, triages):
+        entry["triage_status"] = triage[0]
+        entry["calculated_next_donation_date"] = triage[3]
+        pending.append((entry, donor_upsert_params(data, triage, today)))
+
+    if pending:
+        # Uma única transação por lote: o UPSERT de todas as linhas em um
+        # executemany e, depois, uma consulta com o id de cada identidade do lote
+        # (novo ou já cadastrado, inclusive quando a mesma pessoa aparece duas
+        # vezes no arquivo).
+        try:
+            db.executemany(DONOR_UPSERT_SQL, [params for _, params in pending])
+            identity_keys = list({params[0] for _, params in pending})
+            ids_by_key = dict(db.execute(
+                "SELECT identity_key, id FROM donors WHERE identity_key IN (SELECT value FROM json_each(?))",
+                (json.dumps(identity_keys),)
+            ).fetchall())
+            donor_ids = [ids_by_key[params[0]] for _, params in pending]
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            current_app.logger.error(f"Erro de banco de dados na importação: {e}")
+            for entry, _ in pending:
+                row_number = entry["row"]
+                entry.clear()
+                entry.update({"row": row_number, "status": "error", "error": f"Erro ao salvar no banco de dados: {e}"})
+        else:
+            for (entry, _), donor_id in zip(pending, donor_ids):
+                entry["id"] = donor_id
+    report.extend(entries)
+
+
+def import_donors(db, rows, batch_size=500, first_row=2):
+    """Importa um iterável de doadores em lotes. Retorna o relatório por linha.
+
+    Por padrão a numeração considera o cabeçalho do arquivo como linha 1. Se o
+    arquivo se mostrar inválido no meio da leitura, os lotes anteriores ficam
+    gravados e o relatório termina com uma entrada de erro do arquivo.
+    """
+    report = []
+    batch = []
+    row_number = first_row - 1
+    try:
+        for row_number, data in enumerate(rows, start=first_row):
+            batch.append((row_number, data))
+            if len(batch) >= batch_size:
+                _insert_import_batch(db, batch, report)
+                batch = []
+    except (ValueError, KeyError, csv.Error, zipfile.BadZipFile) as e:
+        report.append({"row": row_number + 1, "status": "error", "error": f"Arquivo inválido ou em formato não suportado: {e}"})
+    if batch:
+        _insert_import_batch(db, batch, report)
+    return report
+
+
+def _import_summary(report):
+    imported = sum(1 for entry in report if entry["status"] == "ok")
+    return {"imported": imported, "failed": len(report) - imported, "rows": report}
+
+
+@app.route('/api/donors/bulk', methods=['POST'])
+@login_required 
+def bulk_import_donors():
+    if request.is_json:
+        rows = request.get_json()
+        if not isinstance(rows, list):
+            return jsonify({"error": "Envie uma lista de doadores"}), 400
+        rows = (_normalize_import_row(row) if isinstance(row, dict) else {} for row in rows)
+        first_row = 1
+    else:
+        uploaded = request.files.get('file')
+        if not uploaded or not uploaded.filename:
+            return jsonify({"error": "Nenhum arquivo enviado (campo 'file')"}), 400
+        rows = iter_import_file(uploaded.stream, uploaded.filename)
+        first_row = 2
+
+    report = import_donors(get_db(), rows, batch_size=app.config['IMPORT_BATCH_SIZE'], first_row=first_row)
+    return jsonify(_import_summary(report)), 200
+
+
+@app.cli.command('import-donors')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=None, type=int, help='Doadores por transação.')
+def import_donors_command(path, batch_size):
+    """Importa doadores de um arquivo CSV ou XLSX, com triagem de cada linha."""
+    with open(path, 'rb') as f:
+        report = import_donors(
+            get_db(), iter_import_file(f, path),
+            batch_size=batch_size or app.config['IMPORT_BATCH_SIZE']
+        )
+    summary = _import_summary(report)
+    for entry in report:
+        if entry["status"] == "error":
+            print(f"Linha {entry['row']}: {entry['error']}")
+    print(f"{summary['imported']} doador(es) importado(s), {summary['failed']} com erro.")
+
+
+# --- Versão dos Dados e Respostas Condicionais (ETag/304) ---
+# Toda escrita em donors incrementa data_versions (por trigger), então a versão
+# identifica o conteúdo da listagem e da planilha: se o cliente já tem a versão
+# atual, a resposta é um 304 sem consultar os doadores.
+def get_data_version(db, name='donors'):
+    row = db.execute('SELECT version, modified_at FROM data_versions WHERE name = ?', (name,)).fetchone()
+    if row is None:
+        return 0, None
+    modified_at = row['modified_at']
+    if isinstance(modified_at, datetime):
+        # CURRENT_TIMESTAMP do SQLite é UTC.
+        modified_at = modified_at.replace(tzinfo=timezone.utc)
+    return row['version'], modified_at
+
+
+def _apply_cache_headers(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # O navegador guarda a resposta, mas sempre revalida com o servidor.
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    """Resposta 304 se a requisição já tem esta versão (If-None-Match/If-Modified-Since), senão None."""
+    if request.if_none_match:
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif request.if_modified_since is None or last_modified is None:
+        return None
+    elif last_modified.replace(microsecond=0) > request.if_modified_since:
+        return None
+    return _apply_cache_headers(current_app.response_class(status=304), etag, last_modified)
+
+
+class BytesLRUCache:
+    """Cache LRU limitado pelo total de bytes guardados (ex.: planilhas prontas)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+spreadsheet_cache = BytesLRUCache(app.config['SPREADSHEET_CACHE_MAX_BYTES'])
+
+
+# Paginação por cursor (keyset) em (registration_date, id): cada página continua
+# exatamente de onde a anterior parou, usando o índice em vez de OFFSET.
+DONORS_PAGE_DEFAULT_LIMIT = 50
+DONORS_PAGE_MAX_LIMIT = 500
+BLOOD_TYPES = ("A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-")
+DISPLAY_STATUSES = ("apto", "aguardando_intervalo", "inapto_temporario", "apto_pos_espera", "inapto_permanente")
+
+
+def encode_donors_cursor(registration_date, donor_id):
+    raw = json.dumps([str(registration_date), donor_id]).encode('utf8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_donors_cursor(cursor_str):
+    try:
+        registration_date, donor_id = json.loads(base64.urlsafe_b64decode(cursor_str.encode('ascii')))
+        return str(registration_date), int(donor_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Cursor de paginação inválido.")
+
+
+def _parse_iso_date_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Data inválida em '{name}' (use AAAA-MM-DD).")
+
+
+def build_donors_filters(args):
+    """Monta a cláusula WHERE e os parâmetros a partir dos filtros da query string."""
+    clauses = []
+    params = {}
+
+    blood_type = args.get('blood_type')
+    if blood_type:
+        if blood_type not in BLOOD_TYPES:
+            raise ValueError(f"Tipo sanguíneo inválido: {blood_type}")
+        clauses.append("blood_type = :blood_type")
+        params['blood_type'] = blood_type
+
+    display_status = args.get('display_status')
+    if display_status:
+        statuses = [s for s in display_status.split(',') if s]
+        for status in statuses:
+            if status not in DISPLAY_STATUSES:
+                raise ValueError(f"Status inválido: {status}")
+        placeholders = ", ".join(f":status_{i}" for i in range(len(statuses)))
+        clauses.append(f"display_status IN ({placeholders})")
+        params.update({f"status_{i}": status for i, status in enumerate(statuses)})
+
+    registered_from = _parse_iso_date_arg(args, 'registered_from')
+    if registered_from:
+        clauses.append("registration_date >= :registered_from")
+        params['registered_from'] = registered_from.isoformat()
+    registered_to = _parse_iso_date_arg(args, 'registered_to')
+    if registered_to:
+        # registration_date é um TIMESTAMP: inclui o dia inteiro de `registered_to`.
+        clauses.append("registration_date < :registered_to")
+        params['registered_to'] = (registered_to + timedelta(days=1)).isoformat()
+
+    next_from = _parse_iso_date_arg(args, 'next_from')
+    if next_from:
+        clauses.append("calculated_next_donation_date >= :next_from")
+        params['next_from'] = next_from.isoformat()
+    next_to = _parse_iso_date_arg(args, 'next_to')
+    if next_to:
+        clauses.append("calculated_next_donation_date <= :next_to")
+        params['next_to'] = next_to.isoformat()
+
+    return clauses, params
+
+
+@app.route('/api/donors', methods=['GET'])
+@login_required 
+def get_donors():
+    try:
+        limit = int(request.args.get('limit', DONORS_PAGE_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Parâmetro 'limit' inválido."}), 400
+    limit = max(1, min(limit, DONORS_PAGE_MAX_LIMIT))
+
+    try:
+        clauses, params = build_donors_filters(request.args)
+        cursor_str = request.args.get('cursor')
+        if cursor_str:
+            params['cursor_date'], params['cursor_id'] = decode_donors_cursor(cursor_str)
+            clauses.append("(registration_date, id) < (:cursor_date, :cursor_id)")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db(readonly=True)
+    # A versão é lida antes da consulta: o conteúdo devolvido nunca é mais
+    # antigo que a ETag que o identifica.
+    version, modified_at = get_data_version(db)
+    query_hash = hashlib.sha1(request.query_string).hexdigest()[:16]
+    etag = f"donors-{version}-{query_hash}"
+    not_modified = not_modified_response(etag, modified_at)
+    if not_modified is not None:
+        return not_modified
+
+    last_event_id = get_last_donor_change_id(db)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    params['limit'] = limit + 1
+    rows = db.execute(
+        f"""
+        SELECT {", ".join(DONOR_PUBLIC_COLUMNS)} FROM donors {where}
+        ORDER BY registration_date DESC, id DESC
+        LIMIT :limit
+        """,
+        params
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_donors_cursor(rows[-1]['registration_date'], rows[-1]['id'])
+
+    response = jsonify({
+        "donors": [dict(row) for row in rows],
+        "next_cursor": next_cursor,
+        # Ponto de partida do feed /api/donors/stream para esta listagem.
+        "last_event_id": last_event_id
+    })
+    return _apply_cache_headers(response, etag, modified_at)
+
+
+@app.route('/api/donors/status-counts')
+@login_required 
+def get_donor_status_counts():
+    db = get_db(readonly=True)
+    counts = {status: 0 for status in DISPLAY_STATUSES}
+    for row in db.execute('SELECT display_status, total FROM donor_status_counts'):
+        counts[row['display_status']] = row['total']
+    return jsonify(counts)
+
+
+# --- Busca de Doadores (FTS5) ---
+# Busca por prefixo em nome e contato, sem diferenciar acentos e maiúsculas, na
+# tabela virtual donors_fts (mantida por triggers). Cada palavra digitada vira um
+# termo de prefixo e todas precisam aparecer, em qualquer ordem.
+DONOR_SEARCH_DEFAULT_LIMIT = 10
+DONOR_SEARCH_MAX_LIMIT = 50
+DONOR_SEARCH_MAX_TERMS = 6
+# Até este número de resultados, todos são ordenados por relevância; acima dele,
+# a busca devolve os cadastros mais recentes, que o índice entrega já em ordem.
+# (O bm25 do FTS5 não serve aqui: ele percorre a lista completa de cada termo,
+# dezenas de ms para um "silva" em um milhão de doadores.)
+DONOR_SEARCH_RANK_CAP = 500
+DONOR_SEARCH_COLUMNS = """
+    id, name, birth_date, blood_type, contact_info, last_donation_date, display_status,
+    calculated_next_donation_date, registration_date
+"""
+
+
+def donor_search_terms(text):
+    """Termos normalizados do texto digitado (letras e números separados, como no índice)."""
+    words = re.findall(r'[^\W_]+', normalize_donor_name(search_contact_text(text)))
+    return [word for word in words if len(word) >= 2][:DONOR_SEARCH_MAX_TERMS]
+
+
+def build_donor_search_query(terms):
+    """Expressão MATCH do FTS5: cada termo entre aspas (operadores digitados não têm efeito) e como prefixo.
+
+    Termos de uma letra já foram descartados: não há índice de prefixo para eles.
+    """
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def donor_search_rank(identity_key, donor_id, terms):
+    """Chave de relevância: termos achados no nome, palavras inteiras, nome mais curto, cadastro mais recente.
+
+    Usa o nome já normalizado da identity_key, sem refazer a normalização por linha.
+    """
+    name = f" {identity_key.partition('|')[0]} "
+    in_name = sum(f" {term}" in name for term in terms)
+    whole_words = sum(f" {term} " in name for term in terms)
+    return (in_name, whole_words, -name.count(' '), donor_id)
+
+
+@app.route('/api/donors/search')
+@login_required 
+def search_donors():
+    terms = donor_search_terms(request.args.get('q'))
+    if not terms:
+        return jsonify({"error": "Digite ao menos 2 letras ou números para buscar."}), 400
+    try:
+        limit = _bounded_int_arg(request.args, 'limit', DONOR_SEARCH_DEFAULT_LIMIT, DONOR_SEARCH_MAX_LIMIT)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db(readonly=True)
+    # Uma passada no índice: até RANK_CAP + 1 ids, dos mais recentes aos mais antigos.
+    ids = [row[0] for row in db.execute(
+        'SELECT rowid FROM donors_fts WHERE donors_fts MATCH ? ORDER BY rowid DESC LIMIT ?',
+        (build_donor_search_query(terms), DONOR_SEARCH_RANK_CAP + 1)
+    )]
+    ranked = len(ids) <= DONOR_SEARCH_RANK_CAP
+    if ranked:
+        keys = db.execute(
+            'SELECT id, identity_key FROM donors WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(ids),)
+        ).fetchall()
+        keys.sort(key=lambda row: donor_search_rank(row['identity_key'], row['id'], terms), reverse=True)
+        ids = [row['id'] for row in keys]
+    page = ids[:limit]
+    rows = {row['id']: row for row in db.execute(
+        f'SELECT {DONOR_SEARCH_COLUMNS} FROM donors WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(page),)
+    )}
+    return jsonify({
+        "results": [dict(rows[donor_id]) for donor_id in page if donor_id in rows],
+        # false quando houve mais de DONOR_SEARCH_RANK_CAP resultados (ordem: mais recentes)
+        "ranked": ranked,
+        "more": len(ids) > limit,
+    })
+
+
+def rebuild_donor_search(db):
+    """Reconstrói donors_fts a partir de donors (bancos antigos ou divergência).
+
+    O 'optimize' junta os segmentos do índice em um só, como fica depois de uma
+    carga grande; buscas em índice fragmentado chegam a levar o dobro do tempo.
+    Não faz commit, como rebuild_donor_stats.
+    """
+    db.execute("INSERT INTO donors_fts (donors_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO donors_fts (donors_fts) VALUES ('optimize')")
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Reconstrói o índice de busca de doadores (donors_fts)."""
+    db = get_db()
+    rebuild_donor_search(db)
+    db.commit()
+    print("Índice de busca reconstruído.")
+
+
+# --- Chamada de Doadores (quem pode doar entre as datas A e B) ---
+# Lista para a equipe ligar para os doadores liberados em uma janela de datas,
+# filtrada pelos tipos sanguíneos em falta. Cada tipo é uma varredura do índice
+# (blood_type, calculated_next_donation_date), que já devolve as linhas em ordem
+# de data; com vários tipos, as varreduras são intercaladas (heapq.merge) em vez
+# de ordenar a janela inteira. Doadores inaptos permanentes não têm data e nunca
+# entram na lista.
+RECALL_DEFAULT_DAYS = 30
+RECALL_PAGE_DEFAULT_LIMIT = 100
+RECALL_PAGE_MAX_LIMIT = 1000
+RECALL_CSV_CHUNK_ROWS = 500
+RECALL_COLUMNS = (
+    "id", "name", "blood_type", "contact_info", "last_donation_date",
+    "calculated_next_donation_date", "display_status",
+)
+RECALL_CSV_HEADERS = (
+    "ID", "Nome", "Tipo Sanguíneo", "Email/Telefone", "Última Doação",
+    "Próxima Data Possível", "Status",
+)
+
+
+def parse_recall_args(args):
+    """(tipos sanguíneos, data inicial, data final) a partir da query string ou das opções da CLI.
+
+    Sem tipo, todos os tipos; sem datas, de hoje até RECALL_DEFAULT_DAYS dias depois.
+    """
+    blood_types = [bt.strip() for bt in (args.get('blood_type') or '').split(',') if bt.strip()]
+    for blood_type in blood_types:
+        if blood_type not in BLOOD_TYPES:
+            raise ValueError(f"Tipo sanguíneo inválido: {blood_type}")
+    date_from = _parse_iso_date_arg(args, 'from') or date.today()
+    date_to = _parse_iso_date_arg(args, 'to') or date_from + timedelta(days=RECALL_DEFAULT_DAYS)
+    if date_to < date_from:
+        raise ValueError("A data final ('to') é anterior à inicial ('from').")
+    # dict.fromkeys: tipos repetidos na query string viram uma varredura só.
+    return list(dict.fromkeys(blood_types)) or list(BLOOD_TYPES), date_from, date_to
+
+
+def iter_recall_donors(db, blood_types, date_from, date_to, after=None):
+    """Doadores liberados entre date_from e date_to (inclusive), em ordem de (data, id).
+
+    `after` é o (data, id) da última linha já entregue (cursor da página anterior).
+    As linhas são lidas do banco só à medida que o iterador é consumido.
+    """
+    params = {'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(), 'after_date': None, 'after_id': None}
+    if after is not None:
+        # A varredura começa na data do cursor (e não no início da janela); na
+        # própria data do cursor, só os ids seguintes.
+        params['after_date'], params['after_id'] = after
+        params['date_from'] = max(params['date_from'], params['after_date'])
+    scans = [
+        db.execute(
+            f"""
+            SELECT {", ".join(RECALL_COLUMNS)} FROM donors
+            WHERE blood_type = :blood_type
+              AND calculated_next_donation_date BETWEEN :date_from AND :date_to
+              AND (:after_id IS NULL OR calculated_next_donation_date > :after_date OR id > :after_id)
+            ORDER BY calculated_next_donation_date, id
+            """,
+            {**params, 'blood_type': blood_type}
+        )
+        for blood_type in blood_types
+    ]
+    return heapq.merge(*scans, key=lambda row: (row['calculated_next_donation_date'], row['id']))
+
+
+def iter_recall_csv(rows):
+    """CSV (com BOM, para o Excel reconhecer o UTF-8) em blocos de RECALL_CSV_CHUNK_ROWS linhas."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(RECALL_CSV_HEADERS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(tuple(row))
+        if count % RECALL_CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@app.route('/api/donors/recall')
+@login_required 
+def recall_donors():
+    try:
+        blood_types, date_from, date_to = parse_recall_args(request.args)
+        limit = _bounded_int_arg(request.args, 'limit', RECALL_PAGE_DEFAULT_LIMIT, RECALL_PAGE_MAX_LIMIT)
+        cursor_str = request.args.get('cursor')
+        # Mesmo formato do cursor da listagem, com a data de liberação no lugar da de cadastro.
+        after = decode_donors_cursor(cursor_str) if cursor_str else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    output_format = request.args.get('format', 'json')
+    if output_format not in ('json', 'csv'):
+        return jsonify({"error": "Formato inválido (use json ou csv)."}), 400
+
+    db = get_db(readonly=True)
+    version, modified_at = get_data_version(db)
+    query_hash = hashlib.sha1(request.query_string).hexdigest()[:16]
+    # Sem 'from', a janela começa hoje: as datas resolvidas também entram na ETag.
+    etag = f"recall-{version}-{date_from.isoformat()}-{date_to.isoformat()}-{query_hash}"
+    not_modified = not_modified_response(etag, modified_at)
+    if not_modified is not None:
+        return not_modified
+
+    rows = iter_recall_donors(db, blood_types, date_from, date_to, after)
+    if output_format == 'csv':
+        # A lista inteira (a partir do cursor, se houver), enviada enquanto é lida.
+        response = current_app.response_class(stream_with_context(iter_recall_csv(rows)), mimetype='text/csv')
+        filename = f"chamada_{'_'.join(blood_types) if len(blood_types) < len(BLOOD_TYPES) else 'todos'}"
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename="{filename}_{date_from.isoformat()}_{date_to.isoformat()}.csv"'
+        )
+        return _apply_cache_headers(response, etag, modified_at)
+
+    page = list(itertools.islice(rows, limit + 1))
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_donors_cursor(page[-1]['calculated_next_donation_date'], page[-1]['id'])
+    response = jsonify({
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "blood_types": blood_types,
+        "donors": [dict(row) for row in page],
+        "next_cursor": next_cursor,
+    })
+    return _apply_cache_headers(response, etag, modified_at)
+
+
+@app.cli.command('recall-donors')
+@click.option('--blood-type', 'blood_type', default=None, help='Tipos sanguíneos separados por vírgula (padrão: todos).')
+@click.option('--from', 'date_from', default=None, help='Data inicial AAAA-MM-DD (padrão: hoje).')
+@click.option('--to', 'date_to', default=None, help=f'Data final AAAA-MM-DD (padrão: {RECALL_DEFAULT_DAYS} dias após a inicial).')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Arquivo CSV de saída (padrão: saída padrão).')
+def recall_donors_command(blood_type, date_from, date_to, output):
+    """Lista em CSV os doadores liberados para doar entre duas datas."""
+    try:
+        blood_types, start, end = parse_recall_args({'blood_type': blood_type, 'from': date_from, 'to': date_to})
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    chunks = iter_recall_csv(iter_recall_donors(get_db(readonly=True), blood_types, start, end))
+    if output is None:
+        for chunk in chunks:
+            click.echo(chunk.lstrip('\ufeff'), nl=False)
+        return
+    with open(output, 'w', encoding='utf8', newline='') as f:
+        f.writelines(chunks)
+
+
+# --- Estatísticas do Painel (agregados incrementais) ---
+# As tabelas donor_stats_blood_status, donor_stats_monthly e
+# donor_eligibility_calendar são mantidas por triggers na mesma transação de cada
+# escrita em donors, então /api/stats lê poucas dezenas de linhas, qualquer que
+# seja o número de doadores.
+STATS_ELIGIBLE_STATUSES = ("apto", "apto_pos_espera")
+STATS_WAITING_STATUSES = ("aguardando_intervalo", "inapto_temporario")
+STATS_DEFAULT_DAYS = 90
+STATS_MAX_DAYS = 366
+STATS_DEFAULT_MONTHS = 12
+STATS_MAX_MONTHS = 120
+
+
+def rebuild_donor_stats(db):
+    """Recalcula todas as tabelas de agregados a partir de donors (bancos antigos ou divergência).
+
+    Não faz commit: roda na transação de quem chama (flask rebuild-stats ou migrate_db).
+    """
+    db.execute('DELETE FROM donor_status_counts')
+    db.execute(
+        """
+        INSERT INTO donor_status_counts (display_status, total)
+        SELECT display_status, COUNT(*) FROM donors GROUP BY display_status
+        """
+    )
+    db.execute('DELETE FROM donor_stats_blood_status')
+    db.execute(
+        """
+        INSERT INTO donor_stats_blood_status (blood_type, display_status, total)
+        SELECT blood_type, display_status, COUNT(*) FROM donors GROUP BY blood_type, display_status
+        """
+    )
+    db.execute('DELETE FROM donor_stats_monthly')
+    db.execute(
+        """
+        INSERT INTO donor_stats_monthly (month, total)
+        SELECT substr(registration_date, 1, 7), COUNT(*) FROM donors GROUP BY 1
+        """
+    )
+    db.execute('DELETE FROM donor_eligibility_calendar')
+    db.execute(
+        """
+        INSERT INTO donor_eligibility_calendar (eligible_date, blood_type, total)
+        SELECT calculated_next_donation_date, blood_type, COUNT(*) FROM donors
+        WHERE display_status IN ('inapto_temporario', 'aguardando_intervalo')
+          AND calculated_next_donation_date IS NOT NULL
+        GROUP BY calculated_next_donation_date, blood_type
+        """
+    )
+
+
+def _bounded_int_arg(args, name, default, maximum):
+    try:
+        value = int(args.get(name, default))
+    except ValueError:
+        raise ValueError(f"Parâmetro '{name}' inválido.")
+    return max(1, min(value, maximum))
+
+
+def _empty_blood_stock():
+    return {
+        "total": 0, "eligible": 0, "waiting": 0, "ineligible": 0,
+        "by_status": {status: 0 for status in DISPLAY_STATUSES},
+    }
+
+
+@app.route('/api/stats')
+@login_required 
+def get_stats():
+    try:
+        days = _bounded_int_arg(request.args, 'days', STATS_DEFAULT_DAYS, STATS_MAX_DAYS)
+        months = _bounded_int_arg(request.args, 'months', STATS_DEFAULT_MONTHS, STATS_MAX_MONTHS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db(readonly=True)
+    today = date.today()
+    # O calendário depende da data de hoje, então ela também entra na ETag.
+    version, modified_at = get_data_version(db)
+    etag = f"stats-{version}-{today.isoformat()}-{days}-{months}"
+    not_modified = not_modified_response(etag, modified_at)
+    if not_modified is not None:
+        return not_modified
+
+    status_counts = {status: 0 for status in DISPLAY_STATUSES}
+    blood_types = {blood_type: _empty_blood_stock() for blood_type in BLOOD_TYPES}
+    for row in db.execute('SELECT blood_type, display_status, total FROM donor_stats_blood_status WHERE total > 0'):
+        status, total = row['display_status'], row['total']
+        status_counts[status] = status_counts.get(status, 0) + total
+        stock = blood_types.setdefault(row['blood_type'], _empty_blood_stock())
+        stock["total"] += total
+        stock["by_status"][status] = stock["by_status"].get(status, 0) + total
+        if status in STATS_ELIGIBLE_STATUSES:
+            stock["eligible"] += total
+        elif status in STATS_WAITING_STATUSES:
+            stock["waiting"] += total
+        else:
+            stock["ineligible"] += total
+
+    monthly = [
+        {"month": row['month'], "total": row['total']}
+        for row in db.execute(
+            'SELECT month, total FROM donor_stats_monthly WHERE total > 0 ORDER BY month DESC LIMIT ?',
+            (months,)
+        )
+    ]
+    monthly.reverse()
+
+    # Um item por dia (de amanhã até hoje + days), inclusive os dias sem liberações.
+    calendar = {}
+    for offset in range(1, days + 1):
+        day = (today + timedelta(days=offset)).isoformat()
+        calendar[day] = {"date": day, "total": 0, "by_blood_type": {}}
+    for row in db.execute(
+        """
+        SELECT eligible_date, blood_type, total FROM donor_eligibility_calendar
+        WHERE eligible_date > ? AND eligible_date <= ? AND total > 0
+        """,
+        (today.isoformat(), (today + timedelta(days=days)).isoformat())
+    ):
+        day = calendar[row['eligible_date']]
+        day["total"] += row['total']
+        day["by_blood_type"][row['blood_type']] = row['total']
+
+    response = jsonify({
+        "generated_on": today.isoformat(),
+        "total_donors": sum(status_counts.values()),
+        "status_counts": status_counts,
+        "blood_types": blood_types,
+        "monthly_registrations": monthly,
+        "eligibility_calendar": list(calendar.values()),
+    })
+    return _apply_cache_headers(response, etag, modified_at)
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recalcula as tabelas de estatísticas a partir dos doadores cadastrados."""
+    db = get_db()
+    rebuild_donor_stats(db)
+    db.commit()
+    print("Estatísticas recalculadas.")
+
+
+# --- Exportação de Doadores (modo streaming, memória constante) ---
+# Formatos: xlsx (a planilha formatada de sempre, opcionalmente uma aba por status
+# da triagem), csv, jsonl e parquet (colunar, requer o pacote opcional pyarrow).
+# O SELECT lê só as colunas pedidas e aceita os mesmos filtros de GET /api/donors.
+# Nome da coluna (API, CSV, JSONL, Parquet) -> título na planilha.
+EXPORT_COLUMNS = {
+    'id': "ID",
+    'name': "Nome",
+    'birth_date': "Data Nasc.",
+    'weight': "Peso (kg)",
+    'blood_type': "Tipo Sanguíneo",
+    'contact_info': "Email/Telefone",
+    'last_donation_date': "Última Doação",
+    'triage_result_status': "Status Triagem",
+    'triage_deferral_days': "Dias Inapto",
+    'triage_message': "Mensagem Triagem",
+    'calculated_next_donation_date': "Próxima Data Possível",
+    'registration_date': "Data Cadastro",
+    'display_status': "Status Atual",
+}
+# Colunas da planilha completa (padrão de todos os formatos).
+EXPORT_DEFAULT_COLUMNS = tuple(column for column in EXPORT_COLUMNS if column != 'display_status')
+EXPORT_FILTER_ARGS = ('blood_type', 'display_status', 'registered_from', 'registered_to', 'next_from', 'next_to')
+# formato: (extensão, mimetype)
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+# Tipos das colunas no Parquet (as demais são texto; datas em AAAA-MM-DD).
+EXPORT_PARQUET_TYPES = {'id': 'int64', 'weight': 'float64', 'triage_deferral_days': 'int64'}
+
+SPREADSHEET_CENTERED_COLUMNS = ("ID", "Peso (kg)", "Dias Inapto")
+SPREADSHEET_WIDE_COLUMNS = ("Nome", "Próxima Data Possível", "Data Cadastro", "Email/Telefone")
+# Uma aba por status da triagem (split_by_status), nesta ordem.
+SPREADSHEET_STATUS_SHEETS = {
+    'apto': "Aptos",
+    'inapto_temporario': "Inaptos temporários",
+    'inapto_permanente': "Inaptos permanentes",
+}
+
+
+def parse_export_options(args):
+    """Opções da exportação a partir da query string (ou do JSON de POST /api/exports).
+
+    Devolve um dict canônico, que também serve de chave do cache de planilhas e
+    para reaproveitar um job de exportação igual. ValueError com a mensagem para
+    o usuário se alguma opção for inválida.
+    """
+    if not isinstance(args, dict):
+        raise ValueError("As opções da exportação devem ser um objeto JSON.")
+    for name in ('format', *EXPORT_FILTER_ARGS):
+        if args.get(name) is not None and not isinstance(args[name], str):
+            raise ValueError(f"Opção inválida: {name} deve ser um texto.")
+    columns = args.get('columns')
+    if columns is not None and not isinstance(columns, str) and not (
+        isinstance(columns, list) and all(isinstance(column, str) for column in columns)
+    ):
+        raise ValueError("Opção inválida: columns deve ser um texto ou uma lista de textos.")
+    if args.get('split_by_status') is not None and not isinstance(args['split_by_status'], (str, bool)):
+        raise ValueError("Opção inválida: split_by_status deve ser true/false ou um texto.")
+
+    export_format = args.get('format') or 'xlsx'
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato inválido: {export_format} (use {', '.join(EXPORT_FORMATS)}).")
+    if export_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ValueError("O formato parquet requer o pacote opcional pyarrow (pip install pyarrow).")
+
+    columns = args.get('columns') or []
+    if isinstance(columns, str):
+        columns = columns.split(',')
+    columns = [column.strip() for column in columns if column.strip()] or list(EXPORT_DEFAULT_COLUMNS)
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Colunas desconhecidas: {', '.join(unknown)}.")
+
+    split_by_status = str(args.get('split_by_status') or '').lower() in ('1', 'true', 'sim')
+    if split_by_status and export_format != 'xlsx':
+        raise ValueError("split_by_status só está disponível no formato xlsx.")
+
+    filters = {name: args.get(name) for name in EXPORT_FILTER_ARGS if args.get(name)}
+    build_donors_filters(filters)  # valida os filtros
+    return {
+        "format": export_format,
+        "columns": list(dict.fromkeys(columns)),
+        "filters": filters,
+        "split_by_status": split_by_status,
+    }
+
+
+def export_options_key(options):
+    return json.dumps(options, sort_keys=True)
+
+
+def donor_export_query(options):
+    """(SQL, parâmetros) da exportação: só as colunas pedidas, filtros e ordem por nome.
+
+    Com split_by_status, triage_result_status vem sempre por último (mesmo fora das
+    colunas pedidas), para escolher a aba de cada linha.
+    """
+    selected = list(options['columns'])
+    if options['split_by_status'] and 'triage_result_status' not in selected:
+        selected.append('triage_result_status')
+    clauses, params = build_donors_filters(options['filters'])
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return f"SELECT {', '.join(selected)} FROM donors {where} ORDER BY name ASC", params
+
+
+def _register_spreadsheet_styles(wb):
+    """Registra estilos nomeados compartilhados por todas as células da planilha."""
+    from openpyxl.styles import PatternFill, Font, Alignment, NamedStyle
+
+    alignment_center = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    alignment_left = Alignment(horizontal='left', vertical='center', wrap_text=True)
+    styles = [
+        NamedStyle(name='sangria_cabecalho', font=Font(bold=True), alignment=alignment_center),
+        NamedStyle(name='sangria_centro', alignment=alignment_center),
+        NamedStyle(name='sangria_esquerda', alignment=alignment_left),
+        NamedStyle(name='sangria_apto', alignment=alignment_left,
+                   fill=PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid"),
+                   font=Font(color="006100", bold=True)),
+        NamedStyle(name='sangria_espera', alignment=alignment_left,
+                   fill=PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid"),
+                   font=Font(color="9C5700", bold=True)),
+        NamedStyle(name='sangria_inapto_temporario', alignment=alignment_left,
+                   fill=PatternFill(start_color="FFD1D1", end_color="FFD1D1", fill_type="solid"),
+                   font=Font(color="9C0006", bold=True)),
+        NamedStyle(name='sangria_inapto_permanente', alignment=alignment_left,
+                   fill=PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid"),
+                   font=Font(color="9C0006", bold=True, italic=True)),
+    ]
+    for style in styles:
+        wb.add_named_style(style)
+
+
+def _status_style_name(status_val):
+    # Os status específicos antes do "apto" genérico, que também aparece dentro
+    # de "inapto_temporario" e "inapto_permanente".
+    if "inapto_temporario" in status_val:
+        return 'sangria_inapto_temporario'
+    elif "inapto_permanente" in status_val:
+        return 'sangria_inapto_permanente'
+    elif "espera" in status_val or "aguardando" in status_val:
+        return 'sangria_espera'
+    elif "apto" in status_val:
+        return 'sangria_apto'
+    return 'sangria_esquerda'
+
+
+def _format_registration_date(registration_value):
+    if isinstance(registration_value, datetime):
+        return registration_value.strftime('%d/%m/%Y %H:%M')
+    elif isinstance(registration_value, str):
+        try:
+            return datetime.fromisoformat(registration_value).strftime('%d/%m/%Y %H:%M')
+        except ValueError:
+            return registration_value
+    return '-'
+
+
+def _dash_if_empty(value):
+    return value if value else '-'
+
+
+# Formatação das células da planilha por coluna (as demais vão como estão no banco).
+SPREADSHEET_FORMATTERS = {
+    'contact_info': _dash_if_empty,
+    'last_donation_date': _dash_if_empty,
+    'triage_deferral_days': _dash_if_empty,
+    'calculated_next_donation_date': _dash_if_empty,
+    'registration_date': _format_registration_date,
+}
+
+
+def write_donors_xlsx(cursor, target, columns=EXPORT_DEFAULT_COLUMNS, split_by_status=False, fetch_size=1000):
+    """Escreve os doadores do cursor em `target` lendo em blocos de `fetch_size` linhas.
+
+    Usa um workbook write-only: cada linha é serializada assim que é adicionada,
+    então o uso de memória não cresce com o número de doadores. As linhas do
+    cursor trazem `columns` nessa ordem (ver donor_export_query); com
+    split_by_status, cada status da triagem vai para a sua aba.
+    """
+    import openpyxl
+    from openpyxl.cell import Cell, WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    _register_spreadsheet_styles(wb)
+    headers = [EXPORT_COLUMNS[column] for column in columns]
+
+    # Cada estilo nomeado é resolvido uma única vez; as células reaproveitam o
+    # mesmo array de estilo em vez de procurar o estilo pelo nome a cada célula.
+    style_arrays = {}
+
+    def new_sheet(title):
+        sheet = wb.create_sheet(title)
+        for col_num, header_title in enumerate(headers, 1):
+            column_letter = get_column_letter(col_num)
+            if header_title == "Mensagem Triagem":
+                sheet.column_dimensions[column_letter].width = 50
+            elif header_title in SPREADSHEET_WIDE_COLUMNS:
+                sheet.column_dimensions[column_letter].width = 25
             else:
-                 cell.alignment = alignment_left
-
-            if status_cell_idx > 0 and col_idx == status_cell_idx: 
-                if "apto" in status_val:
-                    cell.fill = fill_apto
-                    cell.font = font_apto
-                elif "espera" in status_val or "aguardando" in status_val: 
-                    cell.fill = fill_espera
-                    cell.font = font_espera
-                elif "inapto_temporario" in status_val:
-                    cell.fill = fill_inapto_temp
-                    cell.font = font_inapto_temp
-                elif "inapto_permanente" in status_val:
-                    cell.fill = fill_inapto_perm
-                    cell.font = font_inapto_perm
-
-    file_stream = io.BytesIO()
-    wb.save(file_stream)
-    file_stream.seek(0)
+                sheet.column_dimensions[column_letter].width = 15
+        if not style_arrays:
+            for style_name in wb.named_styles:
+                prototype = WriteOnlyCell(sheet)
+                prototype.style = style_name
+                style_arrays[style_name] = prototype._style
+        sheet.append([styled(sheet, header_title, 'sangria_cabecalho') for header_title in headers])
+        return sheet
 
-    return send_file(
+    def styled(sheet, value, style_name):
+        # Mesmo que WriteOnlyCell, mas já com o estilo compartilhado.
+        return Cell(sheet, row=1, column=1, value=value, style_array=style_arrays[style_name])
+
+    if split_by_status:
+        sheets = {status: new_sheet(title) for status, title in SPREADSHEET_STATUS_SHEETS.items()}
+    else:
+        sheet = new_sheet("Controle de Doações Sangria")
+
+    formatters = [SPREADSHEET_FORMATTERS.get(column) for column in columns]
+    column_styles = [
+        'sangria_centro' if header_title in SPREADSHEET_CENTERED_COLUMNS else 'sangria_esquerda'
+        for header_title in headers
+    ]
+    status_column = columns.index('triage_result_status') if 'triage_result_status' in columns else None
+    status_styles = {}
+    width = len(columns)
+    # Fora das colunas pedidas, o status vem depois delas (donor_export_query).
+    split_column = width if status_column is None else status_column
+
+    rows_written = 0
+    # Leitura das linhas + montagem e estilo das células.
+    with metrics_phase('spreadsheet_rows'):
+        while True:
+            chunk = cursor.fetchmany(fetch_size)
+            if not chunk:
+                break
+            for donor in chunk:
+                if split_by_status:
+                    status = donor[split_column] or '-'
+                    if status not in sheets:
+                        # Status fora dos três da triagem: aba com o próprio nome.
+                        sheets[status] = new_sheet(status[:31])
+                    sheet = sheets[status]
+                row_data = [
+                    formatter(value) if formatter else value
+                    for formatter, value in zip(formatters, donor[:width])
+                ]
+                cells = [styled(sheet, value, style_name) for value, style_name in zip(row_data, column_styles)]
+                if status_column is not None:
+                    status_val = (row_data[status_column] or "").lower()
+                    if status_val not in status_styles:
+                        status_styles[status_val] = _status_style_name(status_val)
+                    cells[status_column] = styled(sheet, row_data[status_column], status_styles[status_val])
+                sheet.append(cells)
+            rows_written += len(chunk)
+
+    with metrics_phase('spreadsheet_save'):
+        wb.save(target)
+    return rows_written
+
+
+def _export_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def write_donors_csv(cursor, target, columns, fetch_size=1000):
+    """CSV em UTF-8 com os nomes das colunas no cabeçalho e os valores como estão no banco."""
+    text = io.TextIOWrapper(target, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    rows_written = 0
+    with metrics_phase('export_rows'):
+        while True:
+            chunk = cursor.fetchmany(fetch_size)
+            if not chunk:
+                break
+            writer.writerows([_export_value(value) for value in row] for row in chunk)
+            rows_written += len(chunk)
+    text.flush()
+    text.detach()  # `target` continua aberto para quem o passou
+    return rows_written
+
+
+def write_donors_jsonl(cursor, target, columns, fetch_size=1000):
+    """Um objeto JSON por linha, com as colunas pedidas."""
+    rows_written = 0
+    with metrics_phase('export_rows'):
+        while True:
+            chunk = cursor.fetchmany(fetch_size)
+            if not chunk:
+                break
+            target.write(''.join(
+                json.dumps(dict(zip(columns, map(_export_value, row))), ensure_ascii=False) + '\n'
+                for row in chunk
+            ).encode('utf8'))
+            rows_written += len(chunk)
+    return rows_written
+
+
+def write_donors_parquet(cursor, target, columns, fetch_size=1000):
+    """Parquet colunar, um row group por bloco de `fetch_size` linhas (requer pyarrow)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, getattr(pa, EXPORT_PARQUET_TYPES.get(column, 'string'))()) for column in columns])
+    rows_written = 0
+    with metrics_phase('export_rows'), pq.ParquetWriter(target, schema) as writer:
+        while True:
+            chunk = cursor.fetchmany(fetch_size)
+            if not chunk:
+                break
+            values = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array([_export_value(value) for value in column_values], type=field.type)
+                 for column_values, field in zip(values, schema)],
+                schema=schema
+            ))
+            rows_written += len(chunk)
+    return rows_written
+
+
+def write_donors_export(db, options, target, fetch_size=1000):
+    """Executa a consulta da exportação e escreve o arquivo no formato pedido. Retorna o número de linhas."""
+    sql, params = donor_export_query(options)
+    cursor = db.execute(sql, params)
+    try:
+        if options['format'] == 'xlsx':
+            return write_donors_xlsx(cursor, target, options['columns'], options['split_by_status'], fetch_size)
+        writer = {'csv': write_donors_csv, 'jsonl': write_donors_jsonl, 'parquet': write_donors_parquet}
+        return writer[options['format']](cursor, target, options['columns'], fetch_size)
+    finally:
+        cursor.close()
+
+
+def export_download_name(export_format, day=None):
+    extension = EXPORT_FORMATS[export_format][0]
+    return f"sangria_controle_doacoes_{(day or date.today()).isoformat()}.{extension}"
+
+
+@app.route('/api/donors/spreadsheet')
+@login_required 
+def generate_spreadsheet():
+    if not current_user.is_admin:
+        flash('Acesso negado. Esta funcionalidade é restrita a administradores.', 'error')
+        return redirect(url_for('index'))
+    try:
+        options = parse_export_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db(readonly=True)
+    version, modified_at = get_data_version(db)
+    options_key = export_options_key(options)
+    etag = f"planilha-{version}-{hashlib.sha1(options_key.encode('utf8')).hexdigest()[:16]}"
+    not_modified = not_modified_response(etag, modified_at)
+    if not_modified is not None:
+        return not_modified
+
+    cached = spreadsheet_cache.get((version, options_key))
+    if cached is not None:
+        file_stream = io.BytesIO(cached)
+    else:
+        # O arquivo final é montado em um temporário (em disco quando passa do limite)
+        # e enviado em blocos pelo send_file, que fecha o arquivo ao fim da resposta.
+        file_stream = tempfile.SpooledTemporaryFile(max_size=app.config['EXPORT_SPOOL_MAX_BYTES'])
+        try:
+            write_donors_export(db, options, file_stream, fetch_size=app.config['EXPORT_FETCH_SIZE'])
+        except Exception:
+            file_stream.close()
+            raise
+        if file_stream.tell() <= spreadsheet_cache.max_bytes:
+            file_stream.seek(0)
+            spreadsheet_cache.put((version, options_key), file_stream.read())
+        file_stream.seek(0)
+
+    response = send_file(
         file_stream,
         as_attachment=True,
-        download_name=f"sangria_controle_doacoes_{date.today().isoformat()}.xlsx",
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        download_name=export_download_name(options['format']),
+        mimetype=EXPORT_FORMATS[options['format']][1]
+    )
+    return _apply_cache_headers(response, etag, modified_at)
+
+
+# --- Exportação em Segundo Plano (jobs de planilha) ---
+# POST /api/exports cria um job (com as mesmas opções de formato, colunas e filtros
+# de /api/donors/spreadsheet); um processo do pool (fora dos workers web) gera o
+# arquivo a partir de um snapshot somente leitura do banco e o grava em
+# EXPORT_JOBS_DIR. O cliente consulta o status e baixa o arquivo pronto; jobs
+# finalizados (linha e arquivo) são apagados após EXPORT_JOB_RETENTION_HOURS.
+EXPORT_JOB_PENDING = 'pendente'
+EXPORT_JOB_RUNNING = 'em_andamento'
+EXPORT_JOB_DONE = 'concluido'
+EXPORT_JOB_FAILED = 'falhou'
+
+# O processo do pool importa o app com a configuração padrão; estas chaves são
+# copiadas do processo web a cada job.
+EXPORT_WORKER_CONFIG_KEYS = (
+    'DATABASE', 'EXPORT_JOBS_DIR', 'EXPORT_FETCH_SIZE', 'SQLITE_JOURNAL_MODE', 'SQLITE_SYNCHRONOUS',
+    'SQLITE_BUSY_TIMEOUT_MS', 'SQLITE_MMAP_SIZE', 'SQLITE_CACHE_SIZE_KB', 'SQLITE_REUSE_CONNECTIONS',
+)
+
+_export_executor = None
+_export_executor_lock = threading.Lock()
+
+
+def get_export_executor():
+    """Pool de processos das exportações, criado no primeiro job (spawn: sem herdar conexões abertas).
+
+    Se um processo do pool morre (ex.: SIGKILL por falta de memória), o pool fica
+    inutilizável; discard_export_executor o descarta e o próximo job cria outro.
+    """
+    global _export_executor
+    with _export_executor_lock:
+        if _export_executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            _export_executor = ProcessPoolExecutor(
+                max_workers=app.config['EXPORT_JOB_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _export_executor
+
+
+def discard_export_executor(executor):
+    """Descarta `executor` se ainda for o pool atual (outra thread pode já ter trocado)."""
+    global _export_executor
+    with _export_executor_lock:
+        if _export_executor is not executor:
+            return
+        _export_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def export_job_path(job_id, export_format='xlsx'):
+    return os.path.join(app.config['EXPORT_JOBS_DIR'], f"{job_id}.{EXPORT_FORMATS[export_format][0]}")
+
+
+def run_export_job(job_id, config, options):
+    """Executado no processo do pool: gera o arquivo do job e registra o resultado."""
+    app.config.update(config)
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "UPDATE export_jobs SET status = ?, started_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (EXPORT_JOB_RUNNING, job_id)
+        )
+        db.commit()
+
+        target = export_job_path(job_id, options['format'])
+        partial_path = target + '.part'
+        snapshot = get_db(readonly=True)
+        try:
+            # Versão e linhas lidas na mesma transação: com WAL, o snapshot não vê
+            # cadastros feitos durante a exportação nem bloqueia quem cadastra.
+            snapshot.execute('BEGIN')
+            version, _ = get_data_version(snapshot)
+            with open(partial_path, 'wb') as f:
+                rows_written = write_donors_export(snapshot, options, f, fetch_size=app.config['EXPORT_FETCH_SIZE'])
+            snapshot.rollback()
+            os.replace(partial_path, target)
+        except Exception as e:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            current_app.logger.exception(f"Erro ao gerar a exportação do job {job_id}")
+            db.execute(
+                "UPDATE export_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (EXPORT_JOB_FAILED, str(e), job_id)
+            )
+            db.commit()
+            return EXPORT_JOB_FAILED
+
+        db.execute(
+            """
+            UPDATE export_jobs SET status = ?, data_version = ?, row_count = ?, file_size = ?,
+                                   finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (EXPORT_JOB_DONE, version, rows_written, os.path.getsize(target), job_id)
+        )
+        db.commit()
+        return EXPORT_JOB_DONE
+
+
+def _mark_export_job_failed(db, job_id, error):
+    db.execute(
+        """
+        UPDATE export_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status IN (?, ?)
+        """,
+        (EXPORT_JOB_FAILED, str(error) or error.__class__.__name__, job_id, EXPORT_JOB_PENDING, EXPORT_JOB_RUNNING)
+    )
+    db.commit()
+
+
+def _export_job_finished(job_id, executor, future):
+    # Falhas fora do run_export_job (ex.: processo do pool encerrado) não chegam a
+    # atualizar o job; ele é marcado como falho aqui, no processo web.
+    from concurrent.futures.process import BrokenProcessPool
+
+    if future.cancelled():
+        error = RuntimeError("Exportação cancelada.")
+    else:
+        error = future.exception()
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        discard_export_executor(executor)
+    with app.app_context():
+        _mark_export_job_failed(get_db(), job_id, error)
+
+
+def submit_export_job(db, options, requested_by=None):
+    """Cria um job de exportação (opções de parse_export_options) e o envia ao pool. Retorna o id do job."""
+    job_id = uuid.uuid4().hex
+    version, _ = get_data_version(db)
+    db.execute(
+        """
+        INSERT INTO export_jobs (id, status, data_version, format, options, requested_by)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (job_id, EXPORT_JOB_PENDING, version, options['format'], export_options_key(options), requested_by)
+    )
+    db.commit()
+    try:
+        os.makedirs(app.config['EXPORT_JOBS_DIR'], exist_ok=True)
+        config = {key: app.config[key] for key in EXPORT_WORKER_CONFIG_KEYS}
+        # Um pool quebrado (BrokenProcessPool, um RuntimeError) ou já descartado só é
+        # percebido no submit: ele é trocado por um novo e o envio, repetido uma vez.
+        for attempt in range(2):
+            executor = get_export_executor()
+            try:
+                future = executor.submit(run_export_job, job_id, config, options)
+                break
+            except RuntimeError:
+                discard_export_executor(executor)
+                if attempt:
+                    raise
+    except (RuntimeError, OSError) as e:
+        # O job já está gravado como pendente: sem isto, ficaria na fila para sempre.
+        _mark_export_job_failed(db, job_id, e)
+        raise
+    future.add_done_callback(functools.partial(_export_job_finished, job_id, executor))
+    return job_id
+
+
+def fail_stale_export_jobs(db):
+    """Marca como falhos os jobs na fila ou em andamento há mais que EXPORT_JOB_TIMEOUT_MINUTES.
+
+    São jobs perdidos (ex.: o processo web que os enviou reiniciou): sem isto,
+    seriam reaproveitados por POST /api/exports e consultados para sempre.
+    """
+    failed = db.execute(
+        """
+        UPDATE export_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE status IN (?, ?) AND COALESCE(started_at, created_at) < datetime('now', ?)
+        """,
+        (EXPORT_JOB_FAILED, "Tempo esgotado: a exportação não terminou.", EXPORT_JOB_PENDING, EXPORT_JOB_RUNNING,
+         f"-{int(app.config['EXPORT_JOB_TIMEOUT_MINUTES'])} minutes")
+    ).rowcount
+    db.commit()
+    return failed
+
+
+def cleanup_export_jobs(db):
+    """Apaga jobs (e arquivos) mais antigos que a retenção. Retorna quantos foram removidos."""
+    cutoff = f"-{int(app.config['EXPORT_JOB_RETENTION_HOURS'])} hours"
+    expired = db.execute(
+        "SELECT id, format FROM export_jobs WHERE COALESCE(finished_at, created_at) < datetime('now', ?)",
+        (cutoff,)
+    ).fetchall()
+    for job in expired:
+        path = export_job_path(job['id'], job['format'])
+        for candidate in (path, path + '.part'):
+            try:
+                os.remove(candidate)
+            except FileNotFoundError:
+                pass
+        db.execute("DELETE FROM export_jobs WHERE id = ?", (job['id'],))
+    db.commit()
+    return len(expired)
+
+
+def _timestamp_json(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=timezone.utc).isoformat()
+    return value
+
+
+def export_job_json(job):
+    result = {
+        "id": job['id'],
+        "status": job['status'],
+        "options": json.loads(job['options']),
+        "data_version": job['data_version'],
+        "rows": job['row_count'],
+        "file_size": job['file_size'],
+        "error": job['error'],
+        "created_at": _timestamp_json(job['created_at']),
+        "started_at": _timestamp_json(job['started_at']),
+        "finished_at": _timestamp_json(job['finished_at']),
+        "status_url": url_for('get_export_job', job_id=job['id']),
+    }
+    if job['status'] == EXPORT_JOB_DONE:
+        result["download_url"] = url_for('download_export_job', job_id=job['id'])
+    return result
+
+
+def _admin_required_json():
+    if not current_user.is_admin:
+        return jsonify({"error": "Acesso restrito a administradores."}), 403
+    return None
+
+
+@app.route('/api/exports', methods=['POST'])
+@login_required 
+def create_export_job():
+    denied = _admin_required_json()
+    if denied:
+        return denied
+    try:
+        # Opções no corpo JSON ou na query string (sem opções: a planilha completa).
+        body = request.get_json(silent=True)
+        options = parse_export_options(request.args if body is None else body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db = get_db()
+    cleanup_export_jobs(db)
+    fail_stale_export_jobs(db)
+    # Um job da versão atual com as mesmas opções (na fila, em andamento ou
+    # pronto) é reaproveitado em vez de gerar o mesmo arquivo de novo.
+    version, _ = get_data_version(db)
+    job = db.execute(
+        """
+        SELECT * FROM export_jobs
+        WHERE data_version = ? AND options = ? AND status IN (?, ?, ?)
+        ORDER BY created_at DESC LIMIT 1
+        """,
+        (version, export_options_key(options), EXPORT_JOB_PENDING, EXPORT_JOB_RUNNING, EXPORT_JOB_DONE)
+    ).fetchone()
+    if job is not None and (
+        job['status'] != EXPORT_JOB_DONE or os.path.exists(export_job_path(job['id'], job['format']))
+    ):
+        return jsonify(export_job_json(job)), 200
+
+    try:
+        job_id = submit_export_job(db, options, requested_by=current_user.id)
+    except (sqlite3.Error, OSError, RuntimeError) as e:
+        current_app.logger.error(f"Erro ao criar job de exportação: {e}")
+        return jsonify({"error": "Erro ao criar a exportação", "details": str(e)}), 500
+    job = db.execute("SELECT * FROM export_jobs WHERE id = ?", (job_id,)).fetchone()
+    response = jsonify(export_job_json(job))
+    response.headers['Location'] = url_for('get_export_job', job_id=job_id)
+    return response, 202
+
+
+@app.route('/api/exports/<job_id>')
+@login_required 
+def get_export_job(job_id):
+    denied = _admin_required_json()
+    if denied:
+        return denied
+    job = get_db(readonly=True).execute("SELECT * FROM export_jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None:
+        return jsonify({"error": "Exportação não encontrada ou expirada."}), 404
+    return jsonify(export_job_json(job))
+
+
+@app.route('/api/exports/<job_id>/download')
+@login_required 
+def download_export_job(job_id):
+    denied = _admin_required_json()
+    if denied:
+        return denied
+    job = get_db(readonly=True).execute("SELECT * FROM export_jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None:
+        return jsonify({"error": "Exportação não encontrada ou expirada."}), 404
+    if job['status'] != EXPORT_JOB_DONE:
+        return jsonify(export_job_json(job)), 409
+    path = export_job_path(job_id, job['format'])
+    if not os.path.exists(path):
+        return jsonify({"error": "Exportação não encontrada ou expirada."}), 404
+    created_on = job['created_at'].date() if isinstance(job['created_at'], datetime) else date.today()
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=export_download_name(job['format'], created_on),
+        mimetype=EXPORT_FORMATS[job['format']][1]
     )
 
+
+@app.cli.command('cleanup-exports')
+def cleanup_exports_command():
+    """Remove os jobs de exportação (e arquivos) mais antigos que a retenção."""
+    removed = cleanup_export_jobs(get_db())
+    print(f"{removed} exportação(ões) removida(s).")
+
+
+# --- Inicialização (app factory) ---
+def create_app(config=None):
+    """Ponto de entrada dos servidores WSGI: gunicorn "app:create_app()".
+
+    Aplica `config` sobre app.config e, com DATABASE_AUTO_MIGRATE, leva o banco à
+    versão atual do schema (migrate_db). A migração usa uma conexão própria,
+    fechada em seguida: com gunicorn --preload a aplicação é criada no processo
+    mestre, e uma conexão SQLite aberta não pode passar aos workers pelo fork.
+    """
+    if config:
+        app.config.update(config)
+    if app.config['DATABASE_AUTO_MIGRATE']:
+        db = _open_connection(app.config['DATABASE'], readonly=False)
+        db.execute(f"PRAGMA busy_timeout = {int(app.config['DATABASE_MIGRATE_TIMEOUT'] * 1000)}")
+        try:
+            migrate_db(db)
+        finally:
+            db.close()
+    return app
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
@@ -0,0 +1,19 @@
+"""Benchmarks do Sangria.
+
+Semeiam bancos SQLite temporários (schema.sql) com doadores sintéticos e medem a
+triagem (perform_triage) e as rotas HTTP (listagem, estatísticas, busca, chamada,
+planilha e cadastro) com workers simultâneos, reportando vazão, latências p50/p95/p99 e pico
+de memória (RSS). Cada tamanho roda em um processo separado, para que o pico de
+memória de um não contamine o outro.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks                                   # 10 mil doadores
+    python -m benchmarks --sizes 10000 100000 1000000 --cache-dir .bench_cache
+    python -m benchmarks --scenarios triage,list,stats --duration 10 --workers 16
+    python -m benchmarks --save baseline.json              # grava o baseline
+    python -m benchmarks --compare baseline.json           # sai com código 1 se houver regressão
+
+Os scripts bench_export.py, bench_import.py e load_intake.py continuam disponíveis
+para as comparações específicas (memória da exportação, importação em lote e
+configuração do SQLite).
+"""
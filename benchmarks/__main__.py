@@ -0,0 +1,115 @@
+"""Linha de comando dos benchmarks: python -m benchmarks --help"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks import baseline
+from benchmarks.common import PROJECT_ROOT, peak_rss_mb
+from benchmarks.endpoints import SCENARIOS
+
+ALL_SCENARIOS = ('triage',) + SCENARIOS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Benchmarks do Sangria.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help="quantidades de doadores sintéticos (padrão: 10000)")
+    parser.add_argument('--scenarios', default=','.join(ALL_SCENARIOS),
+                        help=f"cenários separados por vírgula (padrão: {','.join(ALL_SCENARIOS)})")
+    parser.add_argument('--workers', type=int, default=8, help="threads simultâneas por cenário de carga")
+    parser.add_argument('--duration', type=float, default=5.0, help="segundos por cenário de carga")
+    parser.add_argument('--triage-calls', type=int, default=20000, help="chamadas de perform_triage medidas")
+    parser.add_argument('--export-runs', type=int, default=2, help="gerações da planilha medidas por tamanho")
+    parser.add_argument('--cache-dir', help="pasta para guardar os bancos semeados entre execuções")
+    parser.add_argument('--save', metavar='JSON', help="grava os resultados como baseline")
+    parser.add_argument('--compare', metavar='JSON', help="compara com um baseline gravado")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="piora relativa aceita antes de acusar regressão (padrão: 0.10)")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(ALL_SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+    return args
+
+
+def run_child(args):
+    """Executado no processo filho: roda a triagem ou um tamanho e imprime o JSON."""
+    if args.child == 'triage':
+        from benchmarks import triage
+        results = triage.run(args.triage_calls)
+        label = 'triage'
+    else:
+        from benchmarks import endpoints
+        size = int(args.child)
+        results = endpoints.run(size, args.scenarios, args.workers, args.duration, args.export_runs, args.cache_dir)
+        label = str(size)
+    results[f"{label}/memory"] = {"peak_rss_mb": peak_rss_mb()}
+    print(json.dumps(results))
+
+
+def spawn_child(target, argv):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks', '--child', target] + argv,
+        cwd=PROJECT_ROOT, check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+    # A última linha é o JSON; o resto é saída do app.
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def print_results(results):
+    print(f"{'cenário':<32} {'reqs':>8} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>6} {'RSS MB':>8}")
+    for name, metrics in results.items():
+        if 'throughput' not in metrics:
+            rss = metrics.get('peak_rss_mb')
+            rss_text = '-' if rss is None else f"{rss:.1f}"
+            print(f"{name:<32} {'':>8} {'':>10} {'':>9} {'':>9} {'':>9} {'':>6} {rss_text:>8}")
+            continue
+        p50, p95, p99 = (
+            '-' if metrics.get(key) is None else f"{metrics[key]:.3f}" for key in ('p50_ms', 'p95_ms', 'p99_ms')
+        )
+        print(f"{name:<32} {metrics['requests']:>8} {metrics['throughput']:>10.1f} "
+              f"{p50:>9} {p95:>9} {p99:>9} {metrics['errors']:>6} {'':>8}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.child:
+        run_child(args)
+        return 0
+
+    if args.cache_dir:
+        args.cache_dir = os.path.abspath(args.cache_dir)
+    child_argv = [
+        '--scenarios', ','.join(args.scenarios), '--workers', str(args.workers),
+        '--duration', str(args.duration), '--triage-calls', str(args.triage_calls),
+        '--export-runs', str(args.export_runs),
+    ] + (['--cache-dir', args.cache_dir] if args.cache_dir else [])
+
+    results = {}
+    if 'triage' in args.scenarios:
+        results.update(spawn_child('triage', child_argv))
+    if set(args.scenarios) & set(SCENARIOS):
+        for size in args.sizes:
+            results.update(spawn_child(str(size), child_argv))
+    print_results(results)
+
+    if args.save:
+        baseline.save(args.save, results)
+        print(f"Baseline gravado em {args.save}.")
+    if args.compare:
+        lines, regressed = baseline.compare(baseline.load(args.compare), results, args.tolerance)
+        print()
+        print("\n".join(lines))
+        if regressed:
+            print(f"Regressão acima de {args.tolerance:.0%} em relação a {args.compare}.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Baselines em JSON e comparação de regressões entre execuções."""
+import json
+import platform
+import sqlite3
+import sys
+from datetime import datetime
+
+# Métricas comparadas: (nome, maior é melhor?)
+COMPARED_METRICS = (("throughput", True), ("p95_ms", False), ("peak_rss_mb", False))
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "argv": sys.argv[1:],
+    }
+
+
+def save(path, results):
+    # allow_nan=False: NaN não é JSON válido; métricas sem amostras vão como null.
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True, allow_nan=False)
+
+
+def load(path):
+    with open(path, encoding='utf8') as f:
+        return json.load(f)
+
+
+def compare(baseline, results, tolerance=0.10):
+    """Compara `results` com o baseline. Retorna (linhas do relatório, houve regressão?)."""
+    lines = []
+    regressed = False
+    env = baseline.get("environment", {})
+    current_env = environment()
+    for key in ("python", "sqlite"):
+        if env.get(key) != current_env[key]:
+            lines.append(f"aviso: baseline gerado com {key} {env.get(key)}, execução atual com {current_env[key]}")
+
+    old_results = baseline.get("results", {})
+    for name in sorted(results):
+        if name not in old_results:
+            lines.append(f"{name:<32} (sem baseline)")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = old_results[name].get(metric), results[name].get(metric)
+            if old is None or new is None or old != old or new != new or old == 0:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "REGRESSÃO" if worse > tolerance else ("melhora" if worse < -tolerance else "ok")
+            regressed = regressed or flag == "REGRESSÃO"
+            lines.append(f"{name:<32} {metric:<12} {old:>12.2f} -> {new:>12.2f} {change:>+8.1%}  {flag}")
+    return lines, regressed
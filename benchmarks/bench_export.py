@@ -0,0 +1,90 @@
+"""Benchmark de tempo e memória da exportação de doadores, por formato.
+
+Para cada tamanho, cria um banco temporário com o schema.sql, insere doadores
+sintéticos e gera cada variante da exportação (a planilha formatada completa,
+CSV, JSONL e Parquet com todas as colunas ou só as de análise) em um processo
+separado, medindo o tempo e o pico de memória (RSS) desse processo. Com a
+exportação em streaming o pico deve ficar praticamente estável entre 1 mil e
+1 milhão de doadores. Sem o pyarrow instalado, as variantes Parquet são puladas.
+
+Uso:
+    python benchmarks/bench_export.py                    # 1k, 10k, 100k
+    python benchmarks/bench_export.py 1000 1000000       # tamanhos escolhidos
+"""
+import importlib.util
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import PROJECT_ROOT, seed_database  # noqa: E402
+
+# Colunas típicas de uma extração para análise (estoque por tipo e data de liberação).
+ANALYTICS_COLUMNS = "id,blood_type,display_status,calculated_next_donation_date"
+# nome: opções da exportação (mesmas chaves da query string)
+EXPORT_VARIANTS = {
+    "xlsx": {},
+    "xlsx por status": {"split_by_status": "1"},
+    "csv": {"format": "csv"},
+    "jsonl": {"format": "jsonl"},
+    "parquet": {"format": "parquet"},
+    "csv análise": {"format": "csv", "columns": ANALYTICS_COLUMNS},
+    "parquet análise": {"format": "parquet", "columns": ANALYTICS_COLUMNS},
+}
+
+
+def run_export(db_path, args):
+    """Executado no processo filho: gera a exportação e imprime tempo, pico de RSS e tamanho."""
+    sys.path.insert(0, PROJECT_ROOT)
+    import app as sangria
+
+    options = sangria.parse_export_options(args)
+    db = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    db.row_factory = sqlite3.Row
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as target:
+        rows = sangria.write_donors_export(db, options, target)
+        size = target.tell()
+    elapsed = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(rows, elapsed, rss_before, rss_after, size)
+
+
+def main(sizes):
+    variants = {
+        name: args for name, args in EXPORT_VARIANTS.items()
+        if args.get("format") != "parquet" or importlib.util.find_spec("pyarrow") is not None
+    }
+    print(f"{'doadores':>10} {'variante':<16} {'segundos':>9} {'linhas/s':>10} {'x xlsx':>7} "
+          f"{'RSS base MB':>12} {'RSS pico MB':>12} {'arquivo MB':>11}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            seed_database(db_path, size)
+            xlsx_elapsed = None
+            for name, args in variants.items():
+                out = subprocess.run(
+                    [sys.executable, __file__, '--child', db_path, json.dumps(args)],
+                    check=True, capture_output=True, text=True
+                ).stdout.split()
+                rows, elapsed, rss_before, rss_after, file_bytes = (
+                    int(out[0]), float(out[1]), int(out[2]), int(out[3]), int(out[4])
+                )
+                xlsx_elapsed = xlsx_elapsed or elapsed
+                # ru_maxrss vem em KB no Linux.
+                print(f"{rows:>10} {name:<16} {elapsed:>9.2f} {rows / elapsed:>10.0f} {xlsx_elapsed / elapsed:>7.1f} "
+                      f"{rss_before / 1024:>12.1f} {rss_after / 1024:>12.1f} {file_bytes / 1024 / 1024:>11.1f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        run_export(sys.argv[2], json.loads(sys.argv[3]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
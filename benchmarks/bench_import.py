@@ -0,0 +1,57 @@
+"""Benchmark da importação em lote contra o cadastro um a um.
+
+Compara POST /api/donors/bulk (triagem em lote; por lote, uma transação com o
+UPSERT de todas as linhas em um executemany e uma consulta dos ids) com o laço de
+POST /api/donors, ambos pelo test client do Flask sobre um banco temporário.
+
+Em 1 CPU, 5000 doadores: ~550 doadores/s no laço e ~5000/s no lote (9-10x). O
+teto do ganho são os triggers que cada linha gravada dispara (busca FTS5,
+agregados, histórico, feed de mudanças): no SQLite custam ~115 us por doador,
+contra ~25 us do INSERT sozinho, com ou sem lote.
+
+Uso:
+    python benchmarks/bench_import.py            # 5000 doadores
+    python benchmarks/bench_import.py 20000
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as sangria  # noqa: E402
+from benchmarks.common import create_bench_user, logged_client, synthetic_donors  # noqa: E402
+
+
+def fresh_client(db_path):
+    sangria.app.config['DATABASE'] = db_path
+    with sangria.app.app_context():
+        sangria.init_db()
+        create_bench_user(sangria.get_db())
+    return logged_client(sangria.app)
+
+
+def main(size):
+    donors = synthetic_donors(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        client = fresh_client(os.path.join(tmp, 'loop.db'))
+        started = time.perf_counter()
+        for donor in donors:
+            client.post('/api/donors', json=donor)
+        loop_elapsed = time.perf_counter() - started
+
+        client = fresh_client(os.path.join(tmp, 'bulk.db'))
+        started = time.perf_counter()
+        response = client.post('/api/donors/bulk', json=donors)
+        bulk_elapsed = time.perf_counter() - started
+        assert response.json['imported'] == size, response.json
+
+    print(f"{'modo':>12} {'segundos':>10} {'doadores/s':>12}")
+    print(f"{'POST loop':>12} {loop_elapsed:>10.2f} {size / loop_elapsed:>12.0f}")
+    print(f"{'bulk':>12} {bulk_elapsed:>10.2f} {size / bulk_elapsed:>12.0f}")
+    print(f"ganho: {loop_elapsed / bulk_elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,111 @@
+"""Benchmark: cadastro de doadores durante um ataque de força bruta ao login.
+
+Threads "atendentes" cadastram doadores (POST /api/donors) enquanto threads
+"atacantes" tentam senhas erradas em POST /login, cada tentativa de um IP
+diferente e alternando entre várias contas existentes (o pior caso para o limite
+por IP e por usuário). Três rodadas sobre o mesmo banco temporário:
+  * sem ataque: só o cadastro, como referência;
+  * ataque sem limites: como antes, todo login calcula o hash na hora;
+  * ataque com limites: token buckets e cálculos de hash simultâneos da configuração atual.
+Reporta latência do cadastro (p50/p99) e, das tentativas de login, quantas
+calcularam o hash e quantas foram recusadas (429/503).
+
+Uso:
+    python benchmarks/bench_login.py                # 4 atendentes, 8 atacantes, 10 s
+    python benchmarks/bench_login.py 4 16 20        # atendentes atacantes segundos
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import app as sangria  # noqa: E402
+from benchmarks.common import format_ms, logged_client, percentile, seed_database  # noqa: E402
+
+TARGET_ACCOUNTS = 50
+DONOR = {'donorName': 'Carga', 'birthDate': '1990-05-01', 'weight': '70', 'bloodType': 'O+', 'feverFlu': 'no'}
+
+
+def create_target_accounts(db):
+    # Mesmo hash para todas as contas: gerar um scrypt por conta levaria segundos.
+    password_hash = generate_password_hash('senha-correta', sangria.app.config['PASSWORD_HASH_METHOD'])
+    db.executemany(
+        "INSERT INTO users (full_name, cpf, birth_date_user, username, password_hash) "
+        "VALUES ('Alvo', ?, '1990-01-01', ?, ?)",
+        [(f"alvo-{i}", f"alvo{i}", password_hash) for i in range(TARGET_ACCOUNTS)]
+    )
+    db.commit()
+
+
+def intake_worker(deadline, latencies):
+    client = logged_client(sangria.app)
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        client.post('/api/donors', json=DONOR)
+        latencies.append(time.perf_counter() - started)
+
+
+def attack_worker(worker_id, deadline, statuses):
+    client = sangria.app.test_client()
+    attempt = 0
+    while time.perf_counter() < deadline:
+        attempt += 1
+        client.environ_base['REMOTE_ADDR'] = f"172.{worker_id}.{attempt // 250 % 250}.{attempt % 250 + 1}"
+        response = client.post('/login', data={'username': f"alvo{attempt % TARGET_ACCOUNTS}", 'password': 'errada'})
+        statuses[response.status_code] += 1
+
+
+def reset_limits(limited, attackers):
+    """Limitadores e hasher novos: com os limites da configuração ou sem limite nenhum."""
+    config = sangria.app.config
+    if limited:
+        sangria.login_ip_limiter = sangria.TokenBucketLimiter(
+            config['LOGIN_IP_BURST'], config['LOGIN_IP_RATE'], config['LOGIN_LIMITER_MAX_KEYS'])
+        sangria.login_user_limiter = sangria.TokenBucketLimiter(
+            config['LOGIN_USER_BURST'], config['LOGIN_USER_RATE'], config['LOGIN_LIMITER_MAX_KEYS'])
+        sangria.password_hasher = sangria.PasswordHasher(
+            config['PASSWORD_HASH_METHOD'], config['PASSWORD_HASH_CONCURRENCY'], config['PASSWORD_HASH_WAIT'])
+    else:
+        sangria.login_ip_limiter = sangria.TokenBucketLimiter(10 ** 9, 10 ** 9, 10 ** 9)
+        sangria.login_user_limiter = sangria.TokenBucketLimiter(10 ** 9, 10 ** 9, 10 ** 9)
+        sangria.password_hasher = sangria.PasswordHasher(config['PASSWORD_HASH_METHOD'], attackers, None)
+
+
+def run(label, intake_threads, attackers, seconds, limited):
+    reset_limits(limited, attackers)
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=intake_worker, args=(deadline, latencies)) for _ in range(intake_threads)]
+    threads += [threading.Thread(target=attack_worker, args=(i, deadline, statuses)) for i in range(attackers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    hashed = statuses[302]  # senha errada conferida: redireciona de volta ao login
+    refused = statuses[429] + statuses[503]
+    print(f"{label:<20} {len(latencies):>8} {format_ms(percentile(latencies, 50)):>8} "
+          f"{format_ms(percentile(latencies, 99)):>8} {sum(statuses.values()):>10} {hashed / seconds:>9.1f} {refused:>9}")
+
+
+def main(intake_threads=4, attackers=8, seconds=10):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'login.db')
+        seed_database(db_path, 10000)
+        sangria.app.config['DATABASE'] = db_path
+        with sangria.app.app_context():
+            create_target_accounts(sangria.get_db())
+        print(f"{intake_threads} atendentes, {attackers} atacantes, {seconds} s, {os.cpu_count()} CPU(s)")
+        print(f"{'rodada':<20} {'cadastros':>8} {'p50 ms':>8} {'p99 ms':>8} {'tentativas':>10} {'hashes/s':>9} {'recusadas':>9}")
+        run('sem ataque', intake_threads, 0, seconds, limited=True)
+        run('ataque sem limites', intake_threads, attackers, seconds, limited=False)
+        run('ataque com limites', intake_threads, attackers, seconds, limited=True)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,94 @@
+"""Benchmark da subida de um worker: tempo de importação, create_app e memória.
+
+Cada medição roda em um processo novo, como um worker do gunicorn sem --preload:
+importa o app, chama create_app (com o banco já na versão atual, a migração é só
+a leitura do user_version) e atende a primeira requisição. A variante "eager"
+importa antes o openpyxl e o pool de processos, como o cabeçalho antigo do
+app.py fazia, para comparar com a importação sob demanda atual ("lazy").
+
+Uso:
+    python benchmarks/bench_startup.py          # 10 processos por variante
+    python benchmarks/bench_startup.py 30
+"""
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Sem importar benchmarks.common aqui: ele importa o app, e o processo filho
+# precisa medir essa importação do zero.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos que o app.py importava no carregamento antes da importação sob demanda.
+EAGER_MODULES = (
+    'openpyxl', 'openpyxl.cell', 'openpyxl.styles', 'openpyxl.utils',
+    'multiprocessing', 'concurrent.futures',
+)
+VARIANTS = ('eager', 'lazy')
+
+
+def rss_mb():
+    """Memória residente atual (MB). No Linux vem de /proc: o ru_maxrss de um
+    processo filho herda o pico do processo pai, que já importou o app."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        # macOS: pico de memória, em bytes.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+
+
+def run_worker(variant, db_path):
+    """Executado no processo filho: imprime os tempos (ms), a memória (MB) e o número de módulos."""
+    rss_interpreter = rss_mb()
+    sys.path.insert(0, PROJECT_ROOT)
+    started = time.perf_counter()
+    if variant == 'eager':
+        for module in EAGER_MODULES:
+            __import__(module)
+    import app as sangria
+    imported = time.perf_counter()
+    application = sangria.create_app({'DATABASE': db_path})
+    created = time.perf_counter()
+    rss_ready = rss_mb()
+    application.test_client().get('/login')
+    first_request = time.perf_counter()
+    print(
+        (imported - started) * 1000, (created - imported) * 1000, (first_request - created) * 1000,
+        rss_interpreter, rss_ready, rss_mb(), len(sys.modules)
+    )
+
+
+def main(runs):
+    from benchmarks.common import seed_database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        seed_database(db_path, 1000)
+        print(f"{'variante':<8} {'import ms':>10} {'create_app ms':>14} {'1ª req ms':>10} "
+              f"{'RSS base MB':>12} {'RSS pronto MB':>14} {'RSS 1ª req MB':>14} {'módulos':>8}")
+        for variant in VARIANTS:
+            samples = []
+            for _ in range(runs):
+                out = subprocess.run(
+                    [sys.executable, __file__, '--child', variant, db_path],
+                    check=True, capture_output=True, text=True
+                ).stdout.split()
+                samples.append([float(value) for value in out])
+            # Medianas: a primeira execução paga o cache de disco e o .pyc.
+            import_ms, create_ms, request_ms, rss_base, rss_ready, rss_request, modules = (
+                statistics.median(column) for column in zip(*samples)
+            )
+            print(f"{variant:<8} {import_ms:>10.1f} {create_ms:>14.2f} {request_ms:>10.1f} "
+                  f"{rss_base:>12.1f} {rss_ready:>14.1f} {rss_request:>14.1f} {modules:>8.0f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        run_worker(sys.argv[2], sys.argv[3])
+    else:
+        sys.path.insert(0, PROJECT_ROOT)
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
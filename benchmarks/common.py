@@ -0,0 +1,244 @@
+"""Utilitários compartilhados pelos benchmarks: banco sintético, dados de cadastro,
+cliente logado e estatísticas de latência/memória."""
+import hashlib
+import itertools
+import os
+import random
+import shutil
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows: sem medição de RSS
+    resource = None
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import (  # noqa: E402
+    donor_identity_key, migrate_db, normalize_contact, normalize_donor_name, search_contact_text
+)
+
+BLOOD_TYPES = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
+STATUSES = ["apto", "inapto_temporario", "inapto_permanente"]
+QUESTIONNAIRE_FIELDS = ["feverFlu", "tattooPiercing", "hepatitis", "stdPositive", "injectedDrugs", "pregnantBreastfeeding"]
+
+# Nomes e sobrenomes comuns: nome + dois sobrenomes dá milhões de combinações,
+# com as repetições de um cadastro real (muitos "Silva", poucos "Bittencourt").
+FIRST_NAMES = [
+    "Maria", "José", "Ana", "João", "Antônio", "Francisca", "Carlos", "Paulo", "Adriana", "Lucas",
+    "Juliana", "Márcia", "Pedro", "Fernanda", "Luiz", "Patrícia", "Marcos", "Aline", "Rafael", "Sandra",
+    "Gabriel", "Camila", "Daniel", "Amanda", "Marcelo", "Bruna", "Bruno", "Letícia", "Eduardo", "Júlia",
+    "Felipe", "Luana", "Raimundo", "Beatriz", "Rodrigo", "Vitória", "Manoel", "Larissa", "Mateus", "Mariana",
+    "André", "Gabriela", "Fernando", "Conceição", "Fábio", "Rafaela", "Leonardo", "Isabela", "Gustavo", "Jéssica",
+    "Guilherme", "Vanessa", "Leandro", "Tatiane", "Tiago", "Natália", "Anderson", "Renata", "Ricardo", "Cristina",
+    "Márcio", "Simone", "Jorge", "Débora", "Sebastião", "Helena", "Alexandre", "Sônia", "Roberto", "Lúcia",
+    "Edson", "Raquel", "Diego", "Carla", "Vitor", "Priscila", "Sérgio", "Eliane", "Cláudio", "Rosa",
+]
+SURNAMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+    "Rocha", "Dias", "Nascimento", "Andrade", "Moreira", "Nunes", "Marques", "Machado", "Mendes", "Freitas",
+    "Cardoso", "Ramos", "Gonçalves", "Santana", "Teixeira", "Araújo", "Pinto", "Correia", "Cavalcanti", "Monteiro",
+    "Moura", "Batista", "Campos", "Castro", "Borges", "Melo", "Reis", "Azevedo", "Nogueira", "Farias",
+    "Bezerra", "Sampaio", "Brandão", "Cunha", "Peixoto", "Queiroz", "Medeiros", "Bittencourt", "Xavier", "Guimarães",
+    "Pacheco", "Tavares", "Vasconcelos", "Siqueira", "Coelho", "Sales", "Aragão", "Fonseca", "Leite", "Prado",
+]
+EMAIL_DOMAINS = ["gmail.com", "hotmail.com", "yahoo.com.br", "outlook.com", "uol.com.br", "bol.com.br"]
+AREA_CODES = ["11", "21", "31", "41", "47", "48", "51", "61", "71", "81", "85", "92"]
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench123'
+_client_addresses = (f"10.0.{n // 250}.{n % 250 + 1}" for n in itertools.count())
+
+
+def schema_fingerprint():
+    with open(os.path.join(PROJECT_ROOT, 'schema.sql'), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def synthetic_person(rng):
+    """(nome, contato) no formato de um cadastro real: e-mail, telefone ou sem contato."""
+    first = rng.choice(FIRST_NAMES)
+    surnames = rng.sample(SURNAMES, 2)
+    name = f"{first} {surnames[0]} {surnames[1]}"
+    kind = rng.random()
+    if kind < 0.45:
+        local = normalize_donor_name(f"{first}.{surnames[1]}").replace(' ', '')
+        contact = f"{local}{rng.randint(1, 9999)}@{rng.choice(EMAIL_DOMAINS)}"
+    elif kind < 0.9:
+        contact = f"({rng.choice(AREA_CODES)}) 9{rng.randint(1000, 9999)}-{rng.randint(0, 9999):04d}"
+    else:
+        contact = None
+    return name, contact
+
+
+def seed_database(path, size, batch_size=10000, with_user=True):
+    """Cria o banco em `path` (schema.sql, já na versão atual) e `size` doadores sintéticos.
+
+    Os doadores entram pelo INSERT normal, então os triggers (contagens,
+    estatísticas, versão, registro de alterações, busca) ficam como em produção.
+    Pessoas repetidas (mesmo nome e data de nascimento) são descartadas e
+    substituídas, até completar `size` doadores distintos.
+    Com with_user=True, cria também o administrador BENCH_USERNAME.
+    """
+    db = sqlite3.connect(path)
+    migrate_db(db)
+    rng = random.Random(size)
+    today = date.today()
+    now = datetime.now().replace(microsecond=0)
+
+    def rows(count):
+        for _ in range(count):
+            status = rng.choice(STATUSES)
+            next_date = None if status == "inapto_permanente" else (today + timedelta(days=rng.randint(-200, 365))).isoformat()
+            display_status = status
+            if status == "inapto_temporario" and next_date <= today.isoformat():
+                display_status = "apto_pos_espera"
+            elif status == "apto" and next_date > today.isoformat():
+                display_status = "aguardando_intervalo"
+            registered = now - timedelta(seconds=rng.randint(0, 2 * 365 * 86400))
+            name, contact = synthetic_person(rng)
+            birth_date = (today - timedelta(days=rng.randint(16 * 365, 69 * 365))).isoformat()
+            yield (
+                donor_identity_key(name, birth_date), name, birth_date,
+                round(rng.uniform(50, 110), 1), rng.choice(BLOOD_TYPES), None, contact, normalize_contact(contact),
+                search_contact_text(contact), status, rng.choice([None, 7, 180]) if status == "inapto_temporario" else None,
+                "Triagem concluída. Mensagem sintética para o benchmark.", next_date, display_status,
+                registered.isoformat(sep=' '),
+            )
+
+    inserted = 0
+    while inserted < size:
+        cursor = db.executemany(
+            """
+            INSERT INTO donors (
+                identity_key, name, birth_date, weight, blood_type, last_donation_date, contact_info, contact_key,
+                contact_search, triage_result_status, triage_deferral_days, triage_message,
+                calculated_next_donation_date, display_status, registration_date
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (identity_key) DO NOTHING
+            """,
+            rows(min(batch_size, size - inserted))
+        )
+        # rowcount não inclui as linhas gravadas pelos triggers.
+        inserted += cursor.rowcount
+        db.commit()
+    # Junta os segmentos do índice de busca, como rebuild_donor_search depois de uma carga.
+    db.execute("INSERT INTO donors_fts (donors_fts) VALUES ('optimize')")
+    db.commit()
+    if with_user:
+        create_bench_user(db)
+    db.close()
+
+
+def create_bench_user(db):
+    db.execute(
+        "INSERT INTO users (full_name, cpf, birth_date_user, username, password_hash, is_admin) "
+        "VALUES ('Benchmark', '000', '1990-01-01', ?, ?, 1)",
+        (BENCH_USERNAME, generate_password_hash(BENCH_PASSWORD))
+    )
+    db.commit()
+
+
+def prepare_database(target_path, size, cache_dir=None):
+    """Banco populado em `target_path`. Com cache_dir, o banco semeado é guardado
+    (por tamanho e versão do schema) e apenas copiado nas execuções seguintes."""
+    if cache_dir is None:
+        seed_database(target_path, size)
+        return target_path
+    os.makedirs(cache_dir, exist_ok=True)
+    cached = os.path.join(cache_dir, f"donors_{size}_{schema_fingerprint()}.db")
+    if not os.path.exists(cached):
+        partial_path = cached + '.part'
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        seed_database(partial_path, size)
+        os.replace(partial_path, cached)
+    # Cópia: os cenários de cadastro escrevem no banco.
+    shutil.copyfile(cached, target_path)
+    return target_path
+
+
+def synthetic_donors(size, seed=None):
+    """Fichas de cadastro (mesmas chaves do formulário) com respostas variadas."""
+    rng = random.Random(size if seed is None else seed)
+    today = date.today()
+    donors = []
+    for i in range(size):
+        donor = {
+            'donorName': f"Doador Sintético {i}",
+            'birthDate': f"{rng.randint(1955, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'weight': str(rng.randint(45, 110)),
+            'bloodType': rng.choice(BLOOD_TYPES),
+            'contactInfo': f"doador{i}@exemplo.com",
+        }
+        if rng.random() < 0.5:
+            donor['lastDonationDate'] = (today - timedelta(days=rng.randint(1, 400))).isoformat()
+        for field in QUESTIONNAIRE_FIELDS:
+            donor[field] = 'yes' if rng.random() < 0.05 else 'no'
+        donors.append(donor)
+    return donors
+
+
+def logged_client(app):
+    """Test client do Flask já autenticado como o administrador do benchmark.
+
+    Cada cliente usa um IP (REMOTE_ADDR) próprio, como atendentes em máquinas
+    diferentes: os benchmarks abrem dezenas de sessões, mais que o limite de
+    tentativas de login de um IP. Quando várias threads entram juntas, o login
+    pode voltar 503 (hashes simultâneos esgotados) e é repetido.
+    """
+    client = app.test_client()
+    client.environ_base['REMOTE_ADDR'] = next(_client_addresses)
+    for _ in range(5):
+        response = client.post('/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+        if response.status_code != 503:
+            break
+    if response.status_code != 302:
+        raise RuntimeError(f"Login do benchmark falhou (HTTP {response.status_code}).")
+    return client
+
+
+def percentile(samples, pct):
+    """Percentil de uma lista de amostras; None sem amostras (vira null no JSON do baseline)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _to_ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def latency_summary(latencies, elapsed, errors=0):
+    """Vazão e percentis (ms) de uma lista de latências em segundos; sem amostras, percentis None."""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": _to_ms(percentile(latencies, 50)),
+        "p95_ms": _to_ms(percentile(latencies, 95)),
+        "p99_ms": _to_ms(percentile(latencies, 99)),
+        "max_ms": _to_ms(max(latencies) if latencies else None),
+    }
+
+
+def format_ms(seconds):
+    """Latência em ms com uma casa decimal, ou '-' sem amostras."""
+    return '-' if seconds is None else f"{seconds * 1000:.1f}"
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo atual (MB), ou None sem o módulo resource."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KB no Linux e em bytes no macOS.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
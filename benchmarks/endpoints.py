@@ -0,0 +1,123 @@
+"""Carga nas rotas HTTP pelo test client do Flask, com vários workers simultâneos.
+
+Cada cenário roda por `duration` segundos com `workers` threads, cada uma com seu
+próprio cliente logado. As leituras não enviam If-None-Match, então medem a
+consulta completa e não o 304. A planilha é medida à parte, em chamadas
+sequenciais com o cache de planilhas desligado.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import latency_summary, logged_client, prepare_database, synthetic_donors
+
+import app as sangria
+
+# Buscas como as digitadas no balcão: prefixos, sobrenome comum, telefone, e-mail.
+SEARCH_URLS = [
+    '/api/donors/search?q=mar silv',
+    '/api/donors/search?q=joao pereira',
+    '/api/donors/search?q=Gonçalves',
+    '/api/donors/search?q=ana bitt',
+    '/api/donors/search?q=fab',
+    '/api/donors/search?q=(11) 9',
+    '/api/donors/search?q=lucas.ribeiro',
+    '/api/donors/search?q=conceicao cavalcanti medeiros',
+]
+
+# nome: (método, URL ou lista de URLs alternadas). O cadastro fica por último porque aumenta o banco.
+LOAD_SCENARIOS = {
+    'list': ('GET', '/api/donors?limit=50'),
+    'list_filtered': ('GET', '/api/donors?blood_type=O-&display_status=apto&limit=50'),
+    'status_counts': ('GET', '/api/donors/status-counts'),
+    'stats': ('GET', '/api/stats'),
+    'search': ('GET', SEARCH_URLS),
+    'recall': ('GET', '/api/donors/recall?blood_type=O-,O%2B&limit=100'),
+    'intake': ('POST', '/api/donors'),
+}
+SCENARIOS = ('list', 'list_filtered', 'status_counts', 'stats', 'search', 'recall', 'spreadsheet', 'intake')
+
+
+def _worker(method, urls, payloads, ready, start_event, deadline_box, results):
+    try:
+        client = logged_client(sangria.app)
+        client.get('/api/donors?limit=1')  # aquecimento: conexões da thread e transição diária
+    except Exception:
+        ready.abort()
+        raise
+    ready.wait()
+    start_event.wait()
+    latencies, errors = [], 0
+    deadline = deadline_box[0]
+    i = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if method == 'POST':
+            response = client.post(urls[0], json=payloads[i % len(payloads)])
+        else:
+            response = client.get(urls[i % len(urls)])
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors += 1
+        i += 1
+    results.append((latencies, errors))
+
+
+def run_load(name, workers, duration):
+    method, urls = LOAD_SCENARIOS[name]
+    if isinstance(urls, str):
+        urls = [urls]
+    payloads = synthetic_donors(1000, seed=1) if method == 'POST' else None
+    # Todas as threads começam juntas, já logadas e aquecidas.
+    ready = threading.Barrier(workers + 1)
+    start_event = threading.Event()
+    deadline_box = [None]
+    results = []
+    threads = [
+        threading.Thread(target=_worker, args=(method, urls, payloads, ready, start_event, deadline_box, results))
+        for _ in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    deadline_box[0] = started + duration
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    return latency_summary(latencies, elapsed, errors=sum(errors for _, errors in results))
+
+
+def run_spreadsheet(runs):
+    client = logged_client(sangria.app)
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(runs):
+        call_started = time.perf_counter()
+        response = client.get('/api/donors/spreadsheet')
+        response.get_data()  # send_file entrega em blocos; inclui a leitura no tempo
+        latencies.append(time.perf_counter() - call_started)
+        if response.status_code >= 400:
+            errors += 1
+        response.close()
+    return latency_summary(latencies, time.perf_counter() - started, errors=errors)
+
+
+def run(size, scenarios=SCENARIOS, workers=8, duration=5.0, export_runs=2, cache_dir=None):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = prepare_database(os.path.join(tmp, 'bench.db'), size, cache_dir)
+        sangria.app.config['DATABASE'] = db_path
+        # Sem cache: cada chamada da planilha mede a geração completa.
+        sangria.spreadsheet_cache.max_bytes = 0
+        for name in SCENARIOS:
+            if name not in scenarios:
+                continue
+            if name == 'spreadsheet':
+                results[f"{size}/spreadsheet"] = run_spreadsheet(export_runs)
+            else:
+                results[f"{size}/{name}"] = run_load(name, workers, duration)
+    return results
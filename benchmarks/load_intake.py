@@ -0,0 +1,84 @@
+"""Teste de carga: cadastros (POST /api/donors) e listagem (GET /api/donors) simultâneos.
+
+Roda a mesma carga duas vezes sobre um banco temporário já populado:
+  * legado: journal padrão (DELETE), synchronous=FULL e uma conexão nova por requisição;
+  * ajustado: configuração atual (WAL, synchronous=NORMAL, mmap/cache e conexões
+    reutilizadas por thread, com leitura em conexão separada).
+Cada thread usa seu próprio test client do Flask. Reporta requisições, erros
+"database is locked" e latências p50/p99 de cada rota.
+
+Uso:
+    python benchmarks/load_intake.py                  # 8 escritores, 8 leitores, 10 s
+    python benchmarks/load_intake.py 16 16 20 50000   # escritores leitores segundos doadores
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as sangria  # noqa: E402
+from benchmarks.common import format_ms, logged_client, percentile, seed_database  # noqa: E402
+
+LEGACY_CONFIG = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_MMAP_SIZE': 0,
+    'SQLITE_CACHE_SIZE_KB': 2000,
+    'SQLITE_REUSE_CONNECTIONS': False,
+}
+TUNED_CONFIG = {key: sangria.app.config[key] for key in LEGACY_CONFIG}
+
+DONOR = {'donorName': 'Carga', 'birthDate': '1990-05-01', 'weight': '70', 'bloodType': 'O+', 'feverFlu': 'no'}
+
+
+def worker(method, deadline, results):
+    client = logged_client(sangria.app)
+    latencies, locked, failed = [], 0, 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        if method == 'POST':
+            response = client.post('/api/donors', json=DONOR)
+        else:
+            response = client.get('/api/donors?limit=50')
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            failed += 1
+            if b'locked' in response.data:
+                locked += 1
+    results.append((method, latencies, locked, failed))
+
+
+def run(label, config, writers, readers, seconds, donors):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'carga.db')
+        seed_database(db_path, donors)
+        sangria.app.config.update(config, DATABASE=db_path)
+        results = []
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=worker, args=('POST', deadline, results)) for _ in range(writers)]
+        threads += [threading.Thread(target=worker, args=('GET', deadline, results)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    for method in ('POST', 'GET'):
+        latencies = [lat for m, lats, _, _ in results if m == method for lat in lats]
+        locked = sum(lock for m, _, lock, _ in results if m == method)
+        failed = sum(fail for m, _, _, fail in results if m == method)
+        print(f"{label:>9} {method:>5} {len(latencies):>8} {len(latencies) / seconds:>8.0f} {failed:>6} {locked:>7} "
+              f"{format_ms(percentile(latencies, 50)):>8} {format_ms(percentile(latencies, 99)):>8}")
+
+
+def main(writers=8, readers=8, seconds=10, donors=20000):
+    print(f"{writers} escritores, {readers} leitores, {seconds} s, {donors} doadores pré-cadastrados")
+    print(f"{'config':>9} {'rota':>5} {'reqs':>8} {'req/s':>8} {'erros':>6} {'locked':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    run('legado', LEGACY_CONFIG, writers, readers, seconds, donors)
+    run('ajustado', TUNED_CONFIG, writers, readers, seconds, donors)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:5]])
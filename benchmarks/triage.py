@@ -0,0 +1,30 @@
+"""Microbenchmark da triagem: perform_triage chamada a chamada e perform_triage_batch."""
+import time
+
+from benchmarks.common import latency_summary, synthetic_donors
+
+import app as sangria
+
+
+def run(calls=20000):
+    forms = synthetic_donors(1000, seed=0)
+    for form in forms:
+        sangria.perform_triage(form)  # aquecimento: regras compiladas e caches de data
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(calls):
+        form = forms[i % len(forms)]
+        call_started = time.perf_counter()
+        sangria.perform_triage(form)
+        latencies.append(time.perf_counter() - call_started)
+    single = latency_summary(latencies, time.perf_counter() - started)
+
+    rounds = max(1, calls // len(forms))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        sangria.perform_triage_batch(forms)
+    elapsed = time.perf_counter() - started
+    batch = {"requests": rounds * len(forms), "errors": 0, "throughput": rounds * len(forms) / elapsed}
+
+    return {"triage/perform_triage": single, "triage/perform_triage_batch": batch}
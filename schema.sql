@@ -1,13 +1,21 @@
-DROP TABLE IF EXISTS donors;
+-- Schema atual do banco. Só usa IF NOT EXISTS (nada é apagado), então é aplicado
+-- tanto a um banco novo quanto, pelas migrações de app.py (migrate_db), a um
+-- banco existente. Mudanças em tabelas que já existem (nova coluna, dados a
+-- recalcular) também precisam de uma migração em SCHEMA_MIGRATIONS.
 
-CREATE TABLE donors (
+CREATE TABLE IF NOT EXISTS donors (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
+    -- Identidade do doador: nome normalizado (sem acentos, minúsculo, espaços
+    -- simples) + data de nascimento. Um doador que volta atualiza a mesma linha.
+    identity_key TEXT NOT NULL,
     name TEXT NOT NULL,
     birth_date TEXT NOT NULL, -- Formato YYYY-MM-DD
     weight REAL NOT NULL,
     blood_type TEXT NOT NULL,
     last_donation_date TEXT, -- Formato YYYY-MM-DD, pode ser NULL
     contact_info TEXT, -- Novo campo para contato (ex: email/telefone)
+    contact_key TEXT, -- contact_info normalizado (e-mail minúsculo ou só os dígitos do telefone)
+    contact_search TEXT, -- contact_info com letras e números separados, indexado pela busca (donors_fts)
 
     -- Resultados da Triagem
     triage_result_status TEXT NOT NULL, -- ex: 'apto', 'inapto_temporario', 'inapto_permanente'
@@ -15,13 +23,309 @@ CREATE TABLE donors (
     triage_message TEXT, -- Mensagem detalhada da triagem
     
     calculated_next_donation_date TEXT, -- Data calculada para próxima doação/liberação YYYY-MM-DD
+    -- Status efetivo na data de hoje (ex: 'apto_pos_espera', 'aguardando_intervalo').
+    -- Gravado no cadastro e atualizado pela transição diária (refresh_display_status).
+    display_status TEXT NOT NULL,
     registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- Data de cadastro
 );
 
--- Nova tabela para usuários (MODIFICADA)
-DROP TABLE IF EXISTS users;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_donors_identity ON donors (identity_key);
+CREATE INDEX IF NOT EXISTS idx_donors_contact ON donors (contact_key);
+
+-- Busca textual (GET /api/donors/search): índice FTS5 de conteúdo externo (os
+-- textos ficam só em donors) sobre nome e contato, sem acentos e com índices de
+-- prefixo de 2 e 3 caracteres. O contato é indexado por contact_search, com
+-- letras e números separados ("maria.silva 84@gmail.com"): com "silva84" como
+-- termo, o prefixo "silva" se expandiria em um termo por número de e-mail.
+-- Mantido pelos triggers abaixo.
+CREATE VIRTUAL TABLE IF NOT EXISTS donors_fts USING fts5(
+    name, contact_search,
+    content='donors', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donors_fts (rowid, name, contact_search) VALUES (NEW.id, NEW.name, NEW.contact_search);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_delete AFTER DELETE ON donors
+BEGIN
+    INSERT INTO donors_fts (donors_fts, rowid, name, contact_search)
+        VALUES ('delete', OLD.id, OLD.name, OLD.contact_search);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_fts_update AFTER UPDATE OF name, contact_search ON donors
+WHEN OLD.name IS NOT NEW.name OR OLD.contact_search IS NOT NEW.contact_search
+BEGIN
+    INSERT INTO donors_fts (donors_fts, rowid, name, contact_search)
+        VALUES ('delete', OLD.id, OLD.name, OLD.contact_search);
+    INSERT INTO donors_fts (rowid, name, contact_search) VALUES (NEW.id, NEW.name, NEW.contact_search);
+END;
+
+-- Índices da listagem paginada (GET /api/donors). O id (rowid) já faz parte de
+-- todo índice do SQLite, então estes cobrem o cursor (registration_date, id).
+CREATE INDEX IF NOT EXISTS idx_donors_registration ON donors (registration_date);
+CREATE INDEX IF NOT EXISTS idx_donors_blood_type_registration ON donors (blood_type, registration_date);
+CREATE INDEX IF NOT EXISTS idx_donors_display_status_registration ON donors (display_status, registration_date);
+-- Usado pela transição diária: só visita as linhas cuja data já chegou.
+CREATE INDEX IF NOT EXISTS idx_donors_display_status_next_date ON donors (display_status, calculated_next_donation_date);
+-- Chamada de doadores (GET /api/donors/recall, flask recall-donors): quem é
+-- liberado em uma janela de datas, por tipo sanguíneo, já na ordem da data.
+CREATE INDEX IF NOT EXISTS idx_donors_blood_type_next_date ON donors (blood_type, calculated_next_donation_date);
+
+-- Contagem de doadores por status efetivo, mantida pelos triggers abaixo.
+CREATE TABLE IF NOT EXISTS donor_status_counts (
+    display_status TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS donors_status_count_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donor_status_counts (display_status, total) VALUES (NEW.display_status, 1)
+        ON CONFLICT (display_status) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_status_count_delete AFTER DELETE ON donors
+BEGIN
+    UPDATE donor_status_counts SET total = total - 1 WHERE display_status = OLD.display_status;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_status_count_update AFTER UPDATE OF display_status ON donors
+WHEN OLD.display_status IS NOT NEW.display_status
+BEGIN
+    UPDATE donor_status_counts SET total = total - 1 WHERE display_status = OLD.display_status;
+    INSERT INTO donor_status_counts (display_status, total) VALUES (NEW.display_status, 1)
+        ON CONFLICT (display_status) DO UPDATE SET total = total + 1;
+END;
+
+-- Agregados do painel de estatísticas (GET /api/stats), mantidos pelos triggers
+-- abaixo na mesma transação da escrita em donors.
+
+-- Estoque por tipo sanguíneo e status efetivo.
+CREATE TABLE IF NOT EXISTS donor_stats_blood_status (
+    blood_type TEXT NOT NULL,
+    display_status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (blood_type, display_status)
+);
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_blood_status_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donor_stats_blood_status (blood_type, display_status, total)
+        VALUES (NEW.blood_type, NEW.display_status, 1)
+        ON CONFLICT (blood_type, display_status) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_blood_status_delete AFTER DELETE ON donors
+BEGIN
+    UPDATE donor_stats_blood_status SET total = total - 1
+        WHERE blood_type = OLD.blood_type AND display_status = OLD.display_status;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_blood_status_update AFTER UPDATE OF blood_type, display_status ON donors
+WHEN OLD.blood_type IS NOT NEW.blood_type OR OLD.display_status IS NOT NEW.display_status
+BEGIN
+    UPDATE donor_stats_blood_status SET total = total - 1
+        WHERE blood_type = OLD.blood_type AND display_status = OLD.display_status;
+    INSERT INTO donor_stats_blood_status (blood_type, display_status, total)
+        VALUES (NEW.blood_type, NEW.display_status, 1)
+        ON CONFLICT (blood_type, display_status) DO UPDATE SET total = total + 1;
+END;
+
+-- Cadastros por mês (AAAA-MM, em UTC como o CURRENT_TIMESTAMP).
+CREATE TABLE IF NOT EXISTS donor_stats_monthly (
+    month TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_monthly_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donor_stats_monthly (month, total) VALUES (substr(NEW.registration_date, 1, 7), 1)
+        ON CONFLICT (month) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_stats_monthly_delete AFTER DELETE ON donors
+BEGIN
+    UPDATE donor_stats_monthly SET total = total - 1 WHERE month = substr(OLD.registration_date, 1, 7);
+END;
+
+-- Calendário de liberação: doadores ainda em espera ('inapto_temporario' ou
+-- 'aguardando_intervalo') por data em que voltam a poder doar. Quando a transição
+-- diária libera o doador, o trigger de atualização o retira do calendário.
+CREATE TABLE IF NOT EXISTS donor_eligibility_calendar (
+    eligible_date TEXT NOT NULL, -- Formato YYYY-MM-DD
+    blood_type TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (eligible_date, blood_type)
+);
+
+CREATE TRIGGER IF NOT EXISTS donors_eligibility_calendar_insert AFTER INSERT ON donors
+WHEN NEW.display_status IN ('inapto_temporario', 'aguardando_intervalo')
+    AND NEW.calculated_next_donation_date IS NOT NULL
+BEGIN
+    INSERT INTO donor_eligibility_calendar (eligible_date, blood_type, total)
+        VALUES (NEW.calculated_next_donation_date, NEW.blood_type, 1)
+        ON CONFLICT (eligible_date, blood_type) DO UPDATE SET total = total + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_eligibility_calendar_delete AFTER DELETE ON donors
+WHEN OLD.display_status IN ('inapto_temporario', 'aguardando_intervalo')
+    AND OLD.calculated_next_donation_date IS NOT NULL
+BEGIN
+    UPDATE donor_eligibility_calendar SET total = total - 1
+        WHERE eligible_date = OLD.calculated_next_donation_date AND blood_type = OLD.blood_type;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_eligibility_calendar_update_old
+AFTER UPDATE OF blood_type, display_status, calculated_next_donation_date ON donors
+WHEN OLD.display_status IN ('inapto_temporario', 'aguardando_intervalo')
+    AND OLD.calculated_next_donation_date IS NOT NULL
+BEGIN
+    UPDATE donor_eligibility_calendar SET total = total - 1
+        WHERE eligible_date = OLD.calculated_next_donation_date AND blood_type = OLD.blood_type;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_eligibility_calendar_update_new
+AFTER UPDATE OF blood_type, display_status, calculated_next_donation_date ON donors
+WHEN NEW.display_status IN ('inapto_temporario', 'aguardando_intervalo')
+    AND NEW.calculated_next_donation_date IS NOT NULL
+BEGIN
+    INSERT INTO donor_eligibility_calendar (eligible_date, blood_type, total)
+        VALUES (NEW.calculated_next_donation_date, NEW.blood_type, 1)
+        ON CONFLICT (eligible_date, blood_type) DO UPDATE SET total = total + 1;
+END;
 
-CREATE TABLE users (
+-- Versão dos dados, incrementada a cada escrita em donors (por trigger). Serve de
+-- ETag/Last-Modified da listagem e da planilha e de chave do cache da planilha.
+CREATE TABLE IF NOT EXISTS data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO data_versions (name) VALUES ('donors') ON CONFLICT (name) DO NOTHING;
+
+CREATE TRIGGER IF NOT EXISTS donors_version_insert AFTER INSERT ON donors
+BEGIN
+    UPDATE data_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP WHERE name = 'donors';
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_version_update AFTER UPDATE ON donors
+BEGIN
+    UPDATE data_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP WHERE name = 'donors';
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_version_delete AFTER DELETE ON donors
+BEGIN
+    UPDATE data_versions SET version = version + 1, modified_at = CURRENT_TIMESTAMP WHERE name = 'donors';
+END;
+
+-- Registro de alterações de doadores (cadastro, retorno e mudança de status efetivo) para o
+-- feed em tempo real (GET /api/donors/stream). O id é o Last-Event-ID do SSE;
+-- registros antigos são apagados na manutenção diária.
+CREATE TABLE IF NOT EXISTS donor_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    donor_id INTEGER NOT NULL,
+    kind TEXT NOT NULL, -- 'insert', 'status' ou 'update' (retorno sem mudança de status)
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_donor_changes_changed_at ON donor_changes (changed_at);
+
+CREATE TRIGGER IF NOT EXISTS donors_change_log_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donor_changes (donor_id, kind) VALUES (NEW.id, 'insert');
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_change_log_update AFTER UPDATE ON donors
+BEGIN
+    INSERT INTO donor_changes (donor_id, kind)
+        VALUES (NEW.id, CASE WHEN OLD.display_status IS NOT NEW.display_status THEN 'status' ELSE 'update' END);
+END;
+
+-- Histórico de comparecimentos: cada triagem de um doador (primeiro cadastro ou
+-- retorno) vira uma linha, gravada pelos triggers abaixo. A transição diária só
+-- altera display_status, então não gera comparecimento.
+CREATE TABLE IF NOT EXISTS donations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    donor_id INTEGER NOT NULL, -- donors.id
+    visit_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    weight REAL NOT NULL,
+    last_donation_date TEXT,
+    triage_result_status TEXT NOT NULL,
+    triage_deferral_days INTEGER,
+    triage_message TEXT,
+    calculated_next_donation_date TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_donations_donor ON donations (donor_id, id);
+
+CREATE TRIGGER IF NOT EXISTS donors_history_insert AFTER INSERT ON donors
+BEGIN
+    INSERT INTO donations (donor_id, weight, last_donation_date, triage_result_status, triage_deferral_days,
+                           triage_message, calculated_next_donation_date)
+        VALUES (NEW.id, NEW.weight, NEW.last_donation_date, NEW.triage_result_status, NEW.triage_deferral_days,
+                NEW.triage_message, NEW.calculated_next_donation_date);
+END;
+
+-- O UPSERT do cadastro sempre inclui triage_result_status no SET, então o
+-- trigger dispara a cada retorno, mesmo que o resultado seja o mesmo.
+CREATE TRIGGER IF NOT EXISTS donors_history_update AFTER UPDATE OF triage_result_status ON donors
+BEGIN
+    INSERT INTO donations (donor_id, weight, last_donation_date, triage_result_status, triage_deferral_days,
+                           triage_message, calculated_next_donation_date)
+        VALUES (NEW.id, NEW.weight, NEW.last_donation_date, NEW.triage_result_status, NEW.triage_deferral_days,
+                NEW.triage_message, NEW.calculated_next_donation_date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donors_history_delete AFTER DELETE ON donors
+BEGIN
+    DELETE FROM donations WHERE donor_id = OLD.id;
+END;
+
+-- Cadastros repetidos de um mesmo doador que a migração do schema original uniu
+-- em uma só linha de donors. Cada linha do grupo, inclusive a que ficou, é
+-- guardada aqui como estava antes da união; nada é apagado sem cópia.
+CREATE TABLE IF NOT EXISTS donors_merged (
+    source_id INTEGER PRIMARY KEY, -- id original em donors
+    merged_into INTEGER NOT NULL, -- donors.id da linha que ficou
+    name TEXT NOT NULL,
+    birth_date TEXT NOT NULL,
+    weight REAL NOT NULL,
+    blood_type TEXT NOT NULL,
+    last_donation_date TEXT,
+    contact_info TEXT,
+    triage_result_status TEXT NOT NULL,
+    triage_deferral_days INTEGER,
+    triage_message TEXT,
+    calculated_next_donation_date TEXT,
+    registration_date TIMESTAMP,
+    merged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_donors_merged_into ON donors_merged (merged_into);
+
+-- Jobs de exportação da planilha em segundo plano (POST /api/exports). O arquivo
+-- gerado fica em EXPORT_JOBS_DIR/<id>.xlsx até a limpeza por retenção.
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id TEXT PRIMARY KEY, -- uuid4 em hexadecimal
+    status TEXT NOT NULL, -- 'pendente', 'em_andamento', 'concluido' ou 'falhou'
+    data_version INTEGER, -- versão dos doadores (data_versions) no snapshot exportado
+    format TEXT NOT NULL DEFAULT 'xlsx', -- 'xlsx', 'csv', 'jsonl' ou 'parquet'
+    options TEXT NOT NULL DEFAULT '{}', -- opções da exportação em JSON canônico (export_options_key)
+    row_count INTEGER,
+    file_size INTEGER,
+    error TEXT,
+    requested_by INTEGER, -- users.id
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Nova tabela para usuários (MODIFICADA)
+CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     full_name TEXT NOT NULL,
     cpf TEXT UNIQUE NOT NULL, -- CPF deve ser único
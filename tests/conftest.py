@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as sangria  # noqa: E402
+
+# Hash barato nos testes: o scrypt padrão leva dezenas de ms por login.
+TEST_HASH_METHOD = 'pbkdf2:sha256:1'
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'secret1'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Aplicação sobre um banco novo em tmp_path, com um administrador cadastrado."""
+    monkeypatch.setitem(sangria.app.config, 'TESTING', True)
+    monkeypatch.setitem(sangria.app.config, 'DATABASE', str(tmp_path / 'sangria.db'))
+    monkeypatch.setitem(sangria.app.config, 'EXPORT_JOBS_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setattr(sangria, 'password_hasher', sangria.PasswordHasher(TEST_HASH_METHOD, 4, 5.0))
+    monkeypatch.setattr(sangria, 'login_ip_limiter', sangria.TokenBucketLimiter(1000, 1000, 1000))
+    monkeypatch.setattr(sangria, 'login_user_limiter', sangria.TokenBucketLimiter(1000, 1000, 1000))
+    # Planilhas em cache são indexadas pela versão dos dados, que recomeça em cada banco novo.
+    monkeypatch.setattr(
+        sangria, 'spreadsheet_cache', sangria.BytesLRUCache(sangria.app.config['SPREADSHEET_CACHE_MAX_BYTES'])
+    )
+    application = sangria.create_app()
+    with application.app_context():
+        db = sangria.get_db()
+        db.execute(
+            "INSERT INTO users (full_name, cpf, birth_date_user, username, password_hash, is_admin) "
+            "VALUES ('Administrador', '000', '1990-01-01', ?, ?, 1)",
+            (ADMIN_USERNAME, generate_password_hash(ADMIN_PASSWORD, TEST_HASH_METHOD))
+        )
+        db.commit()
+    sangria.user_cache.invalidate()
+    yield application
+    # Conexões reaproveitadas pela thread do teste apontam para o banco temporário.
+    for db in getattr(sangria._db_local, 'connections', {}).values():
+        db.close()
+    sangria._db_local.connections = {}
+
+
+@pytest.fixture
+def client(app):
+    """Test client logado como administrador."""
+    client = app.test_client()
+    response = client.post('/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import app as sangria
+
+DONOR = {
+    'donorName': 'Ana Souza', 'birthDate': '1990-05-01', 'weight': '70', 'bloodType': 'O-',
+    'contactInfo': 'ana.souza@example.com',
+}
+INTERNAL_COLUMNS = {'identity_key', 'contact_key', 'contact_search'}
+
+
+def test_donor_list_sends_only_public_columns(client):
+    assert client.post('/api/donors', json=DONOR).status_code == 201
+
+    donors = client.get('/api/donors').get_json()['donors']
+    assert len(donors) == 1
+    assert set(donors[0]) == set(sangria.DONOR_PUBLIC_COLUMNS)
+    assert not INTERNAL_COLUMNS & set(donors[0])
+
+
+def test_donor_stream_sends_only_public_columns(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'SSE_MAX_DURATION', 0.2)
+    monkeypatch.setitem(app.config, 'SSE_POLL_INTERVAL', 0.05)
+    last_event_id = client.get('/api/donors').get_json()['last_event_id']
+    assert client.post('/api/donors', json=DONOR).status_code == 201
+
+    body = client.get(f'/api/donors/stream?last_event_id={last_event_id}').get_data(as_text=True)
+    events = [line[len('data: '):] for line in body.splitlines() if line.startswith('data: ')]
+    assert len(events) == 1
+    donor = json.loads(events[0])
+    assert donor['change'] == 'insert'
+    assert set(donor) == set(sangria.DONOR_PUBLIC_COLUMNS) | {'change'}
+
+
+@pytest.mark.parametrize('field, value', [
+    ('birthDate', 19900501),
+    ('donorName', 12345),
+    ('donorName', ['Ana', 'Souza']),
+    ('contactInfo', 11999990000),
+])
+def test_add_donor_rejects_non_text_fields(client, field, value):
+    response = client.post('/api/donors', json={**DONOR, field: value})
+    assert response.status_code == 400
+    assert field in response.get_json()['error']
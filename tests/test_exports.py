@@ -0,0 +1,137 @@
+import io
+import os
+import signal
+import sqlite3
+import time
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+
+import pytest
+
+import app as sangria
+
+DONOR = {'donorName': 'Ana Souza', 'birthDate': '1990-05-01', 'weight': '70', 'bloodType': 'O-'}
+
+
+@pytest.fixture
+def export_pool(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_JOB_WORKERS', 1)
+    yield
+    executor = sangria._export_executor
+    sangria._export_executor = None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def wait_for_job(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/exports/{job_id}').get_json()
+        if job['status'] in (sangria.EXPORT_JOB_DONE, sangria.EXPORT_JOB_FAILED):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"Job {job_id} não terminou: {job}")
+
+
+def test_export_pool_is_rebuilt_after_worker_is_killed(client, export_pool):
+    client.post('/api/donors', json=DONOR)
+    first = client.post('/api/exports', json={'format': 'csv'})
+    assert first.status_code == 202
+    for process in list(sangria._export_executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    assert wait_for_job(client, first.get_json()['id'])['status'] == sangria.EXPORT_JOB_FAILED
+
+    second = client.post('/api/exports', json={'format': 'csv'})
+    assert second.status_code == 202
+    assert second.get_json()['id'] != first.get_json()['id']
+    assert wait_for_job(client, second.get_json()['id'])['status'] == sangria.EXPORT_JOB_DONE
+
+
+def test_broken_pool_at_submit_is_replaced(client, export_pool, monkeypatch):
+    class BrokenExecutor:
+        def submit(self, *args, **kwargs):
+            raise BrokenProcessPool("processo do pool encerrado")
+
+        def shutdown(self, **kwargs):
+            pass
+
+    monkeypatch.setattr(sangria, '_export_executor', BrokenExecutor())
+    response = client.post('/api/exports', json={'format': 'csv'})
+    assert response.status_code == 202
+    assert wait_for_job(client, response.get_json()['id'])['status'] == sangria.EXPORT_JOB_DONE
+
+
+def test_failed_submit_marks_job_failed(app, client, export_pool, monkeypatch):
+    def broken_executor():
+        class BrokenExecutor:
+            def submit(self, *args, **kwargs):
+                raise BrokenProcessPool("processo do pool encerrado")
+
+            def shutdown(self, **kwargs):
+                pass
+        return BrokenExecutor()
+
+    monkeypatch.setattr(sangria, 'get_export_executor', broken_executor)
+    response = client.post('/api/exports', json={'format': 'csv'})
+    assert response.status_code == 500
+    db = sqlite3.connect(app.config['DATABASE'])
+    assert db.execute("SELECT status FROM export_jobs").fetchall() == [(sangria.EXPORT_JOB_FAILED,)]
+
+
+def test_stale_pending_job_is_not_reused(app, client, export_pool):
+    db = sqlite3.connect(app.config['DATABASE'])
+    version = db.execute("SELECT version FROM data_versions WHERE name = 'donors'").fetchone()[0]
+    options = sangria.export_options_key(sangria.parse_export_options({'format': 'csv'}))
+    db.execute(
+        "INSERT INTO export_jobs (id, status, data_version, format, options, created_at) "
+        "VALUES ('perdido', ?, ?, 'csv', ?, datetime('now', '-2 hours'))",
+        (sangria.EXPORT_JOB_PENDING, version, options)
+    )
+    db.commit()
+
+    response = client.post('/api/exports', json={'format': 'csv'})
+    assert response.status_code == 202
+    assert response.get_json()['id'] != 'perdido'
+    assert client.get('/api/exports/perdido').get_json()['status'] == sangria.EXPORT_JOB_FAILED
+    wait_for_job(client, response.get_json()['id'])
+
+
+@pytest.mark.parametrize('body', [
+    {'columns': [1]},
+    {'columns': 'name', 'format': ['csv']},
+    {'registered_from': 5},
+    {'split_by_status': {'sim': True}},
+    ['csv'],
+    [],
+])
+def test_export_options_with_wrong_types_are_rejected(app, client, body):
+    response = client.post('/api/exports', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    db = sqlite3.connect(app.config['DATABASE'])
+    assert db.execute("SELECT COUNT(*) FROM export_jobs").fetchone()[0] == 0
+
+
+def test_export_options_accept_json_types(client):
+    options = sangria.parse_export_options({'columns': ['name', 'blood_type'], 'split_by_status': True})
+    assert options['columns'] == ['name', 'blood_type']
+    assert options['split_by_status'] is True
+    response = client.get('/api/donors/spreadsheet?format=csv&columns=name&registered_from=2024-01-01')
+    assert response.status_code == 200
+
+
+def test_spreadsheet_status_fills(client):
+    openpyxl = pytest.importorskip('openpyxl')
+    donors = [
+        {**DONOR, 'donorName': 'Apta'},
+        {**DONOR, 'donorName': 'Com Gripe', 'feverFlu': 'yes'},
+        {**DONOR, 'donorName': 'Menor', 'birthDate': (date.today() - timedelta(days=15 * 366)).isoformat()},
+    ]
+    for donor in donors:
+        assert client.post('/api/donors', json=donor).status_code == 201
+
+    response = client.get('/api/donors/spreadsheet?columns=name,triage_result_status')
+    assert response.status_code == 200
+    sheet = openpyxl.load_workbook(io.BytesIO(response.data)).active
+    fills = {row[1].value: row[1].fill.start_color.rgb[-6:] for row in sheet.iter_rows(min_row=2)}
+    assert fills == {'apto': 'C6EFCE', 'inapto_temporario': 'FFD1D1', 'inapto_permanente': 'FFC7CE'}
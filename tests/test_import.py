@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+import app as sangria
+
+RETURNING_DONOR = {'donorName': 'Ana Souza', 'birthDate': '1990-05-01', 'weight': '70', 'bloodType': 'O-'}
+
+
+def test_bulk_import_uses_stored_last_donation_like_single_intake(client):
+    recent = (date.today() - timedelta(days=30)).isoformat()
+    first = client.post('/api/donors', json={**RETURNING_DONOR, 'lastDonationDate': recent})
+    assert first.status_code == 201
+
+    # Retorno sem a data da última doação, pelos dois caminhos.
+    single = client.post('/api/donors', json=RETURNING_DONOR).get_json()
+    bulk = client.post('/api/donors/bulk', json=[RETURNING_DONOR]).get_json()
+
+    assert single['triage_status'] == 'inapto_temporario'
+    row = bulk['rows'][0]
+    assert row['status'] == 'ok'
+    assert row['triage_status'] == single['triage_status']
+    assert row['calculated_next_donation_date'] == single['calculated_next_donation_date']
+
+
+def test_bulk_import_repeated_donor_in_file_counts_as_return(client):
+    recent = (date.today() - timedelta(days=30)).isoformat()
+    report = client.post('/api/donors/bulk', json=[
+        {**RETURNING_DONOR, 'lastDonationDate': recent},
+        RETURNING_DONOR,
+    ]).get_json()
+
+    assert [row['triage_status'] for row in report['rows']] == ['inapto_temporario', 'inapto_temporario']
+    assert report['rows'][0]['id'] == report['rows'][1]['id']
+
+
+def test_bulk_import_reports_each_donor_id(app, client):
+    existing = client.post('/api/donors', json=RETURNING_DONOR).get_json()['id']
+    report = client.post('/api/donors/bulk', json=[
+        {'donorName': 'Bia Lima', 'birthDate': '1985-02-03', 'weight': '65', 'bloodType': 'A+'},
+        {'donorName': 'Sem Peso', 'birthDate': '1985-02-03', 'bloodType': 'A+'},
+        RETURNING_DONOR,
+    ]).get_json()
+
+    assert [row['status'] for row in report['rows']] == ['ok', 'error', 'ok']
+    assert report['rows'][2]['id'] == existing
+    with app.app_context():
+        stored = sangria.get_db().execute("SELECT id FROM donors WHERE name = 'Bia Lima'").fetchone()[0]
+    assert report['rows'][0]['id'] == stored != existing
+
+
+def test_bulk_import_reports_non_text_fields_per_row(client):
+    report = client.post('/api/donors/bulk', json=[
+        {**RETURNING_DONOR, 'donorName': ['Ana', 'Souza']},
+        {**RETURNING_DONOR, 'contactInfo': {'email': 'ana@example.com'}},
+        RETURNING_DONOR,
+    ]).get_json()
+
+    assert [row['status'] for row in report['rows']] == ['error', 'error', 'ok']
+    assert 'donorName' in report['rows'][0]['error']
+    assert 'contactInfo' in report['rows'][1]['error']
@@ -0,0 +1,36 @@
+from werkzeug.security import generate_password_hash
+
+import app as sangria
+from conftest import TEST_HASH_METHOD
+
+
+def test_metrics_requires_admin_without_token(app, client):
+    assert app.test_client().get('/metrics').status_code == 401
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'sangria_login_throttled_total' in response.data
+
+    with app.app_context():
+        db = sangria.get_db()
+        db.execute(
+            "INSERT INTO users (full_name, cpf, birth_date_user, username, password_hash) "
+            "VALUES ('Atendente', '111', '1990-01-01', 'atendente', ?)",
+            (generate_password_hash('secret2', TEST_HASH_METHOD),)
+        )
+        db.commit()
+    attendant = app.test_client()
+    assert attendant.post('/login', data={'username': 'atendente', 'password': 'secret2'}).status_code == 302
+    assert attendant.get('/metrics').status_code == 403
+
+
+def test_metrics_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'segredo')
+    anonymous = app.test_client()
+    assert anonymous.get('/metrics').status_code == 401
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer errado'}).status_code == 401
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer segredo'}).status_code == 200
+
+
+def test_server_timing_only_for_logged_in_users(app, client):
+    assert 'Server-Timing' not in app.test_client().get('/login').headers
+    assert 'Server-Timing' in client.get('/api/donors').headers
@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+import app as sangria
+
+# donors e users como no schema.sql original, antes das migrações.
+LEGACY_SCHEMA = """
+CREATE TABLE donors (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    birth_date TEXT NOT NULL,
+    weight REAL NOT NULL,
+    blood_type TEXT NOT NULL,
+    last_donation_date TEXT,
+    contact_info TEXT,
+    triage_result_status TEXT NOT NULL,
+    triage_deferral_days INTEGER,
+    triage_message TEXT,
+    calculated_next_donation_date TEXT,
+    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name TEXT NOT NULL,
+    cpf TEXT UNIQUE NOT NULL,
+    birth_date_user TEXT NOT NULL,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    registration_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_admin BOOLEAN NOT NULL DEFAULT 0
+);
+"""
+LEGACY_DONORS = [
+    ('Ana Souza', '1990-01-01', 60, 'O-', None, 'ana@example.com', 'apto', None, 'ok', None, '2023-01-01 10:00:00'),
+    ('ana  souza', '1990-01-01', 61, 'O-', '2024-01-01', None, 'inapto_temporario', 7, 'gripe', '2099-01-01',
+     '2024-02-01 10:00:00'),
+    ('Bia', '1985-05-05', 70, 'A+', None, None, 'apto', None, 'ok', None, '2024-03-01 10:00:00'),
+]
+ARCHIVED_COLUMNS = (
+    'name, birth_date, weight, blood_type, last_donation_date, contact_info, triage_result_status, '
+    'triage_deferral_days, triage_message, calculated_next_donation_date, registration_date'
+)
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    path = str(tmp_path / 'legacy.db')
+    db = sqlite3.connect(path)
+    db.executescript(LEGACY_SCHEMA)
+    db.executemany(f"INSERT INTO donors ({ARCHIVED_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", LEGACY_DONORS)
+    db.commit()
+    db.close()
+    monkeypatch.setitem(sangria.app.config, 'DATABASE', path)
+    return path
+
+
+def test_legacy_migration_keeps_merged_rows(legacy_db):
+    sangria.create_app()
+
+    db = sqlite3.connect(legacy_db)
+    assert db.execute("PRAGMA user_version").fetchone()[0] == sangria.SCHEMA_VERSION
+    kept = db.execute(
+        "SELECT id, registration_date, contact_info FROM donors WHERE identity_key = 'ana souza|1990-01-01'"
+    ).fetchall()
+    assert kept == [(2, '2023-01-01 10:00:00', 'ana@example.com')]
+    assert db.execute("SELECT COUNT(*) FROM donors").fetchone()[0] == 2
+
+    # As duas linhas do grupo, como estavam antes da união; Bia não tinha repetição.
+    archived = db.execute(
+        f"SELECT source_id, merged_into, {ARCHIVED_COLUMNS} FROM donors_merged ORDER BY source_id"
+    ).fetchall()
+    assert archived == [(1, 2, *LEGACY_DONORS[0]), (2, 2, *LEGACY_DONORS[1])]
+    db.close()
+
+
+def test_fresh_and_migrated_databases_have_same_objects(legacy_db, tmp_path):
+    sangria.create_app()
+    fresh_path = str(tmp_path / 'fresh.db')
+    sangria.create_app({'DATABASE': fresh_path})
+
+    def schema_objects(path):
+        db = sqlite3.connect(path)
+        objects = db.execute(
+            "SELECT type, name, tbl_name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).fetchall()
+        db.close()
+        return objects
+
+    assert schema_objects(legacy_db) == schema_objects(fresh_path)
@@ -0,0 +1,29 @@
+from datetime import date
+
+import app as sangria
+
+
+def fake_today(monkeypatch, day):
+    class FakeDate(date):
+        @classmethod
+        def today(cls):
+            return day
+
+    monkeypatch.setattr(sangria, 'date', FakeDate)
+
+
+def test_recall_etag_changes_with_default_window(client, monkeypatch):
+    fake_today(monkeypatch, date(2026, 10, 18))
+    first = client.get('/api/donors/recall')
+    assert first.status_code == 200
+    assert first.get_json()['from'] == '2026-10-18'
+
+    fake_today(monkeypatch, date(2026, 10, 20))
+    second = client.get('/api/donors/recall', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()['from'] == '2026-10-20'
+    assert second.headers['ETag'] != first.headers['ETag']
+
+    # Mesmo dia, nenhum doador alterado: a ETag continua valendo.
+    third = client.get('/api/donors/recall', headers={'If-None-Match': second.headers['ETag']})
+    assert third.status_code == 304
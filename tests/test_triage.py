@@ -0,0 +1,24 @@
+import json
+import os
+from datetime import date
+
+import pytest
+
+import app as sangria
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'triage_golden.json')
+
+with open(GOLDEN_PATH, encoding='utf8') as f:
+    GOLDEN_CASES = json.load(f)
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return sangria.TriageEngine.from_file(sangria.app.config['TRIAGE_RULES_PATH'])
+
+
+@pytest.mark.parametrize('case', GOLDEN_CASES, ids=[f"caso-{i}" for i in range(len(GOLDEN_CASES))])
+def test_triage_matches_golden_corpus(engine, case):
+    """Mesma conferência de `flask check-triage`, caso a caso."""
+    result = list(engine.evaluate(case['input'], date.fromisoformat(case['today'])))
+    assert result == case['expected']